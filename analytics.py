@@ -0,0 +1,336 @@
+# analytics.py
+# Пакетная аналитика по истории цен: изменение к вчерашнему дню, скользящее
+# среднее, перцентили и индекс цены конкурента.
+# История одного конкурента грузится столбцами в матрицу «товар × день»
+# (NumPy), все метрики считаются векторно — без Python-цикла по записям.
+
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, and_, or_, func
+
+from database import database, engine
+from models import competitors, price_metrics, alert_rules
+from price_history import expand_intervals
+from schemas import PriceMetric, AnalyticsSummary, AlertRuleCreate, AlertRule, PriceAlert
+
+# ========== НАСТРОЙКИ ==========
+WINDOW_DAYS    = 30      # сколько дней истории берём для перцентилей
+ROLLING_WINDOW = 7       # окно скользящего среднего, дней
+INSERT_BATCH   = 5000    # размер пачки при записи метрик
+# ================================
+
+
+# ----------------------------
+# Векторные примитивы
+# ----------------------------
+
+# Каждая строка цены приходит из SQLite тремя числами: id, цена и упакованное
+# в одно INTEGER значение product_id << 32 | first << 16 | last, где first и
+# last — границы интервала в днях от start, уже обрезанные по окну. Основное
+# время загрузки уходит на создание Python-объектов для значений, так их
+# три на строку вместо пяти.
+# Фильтр идёт по индексам (competitor_id, date / period_start); {since} —
+# нижняя граница начала периода там, где она известна заранее.
+LOAD_PRICES_SQL = """
+    SELECT id,
+           product_id * 4294967296
+             + MAX(CAST(julianday({first}) - julianday(:start) AS INTEGER), 0) * 65536
+             + MIN(CAST(julianday({last}) - julianday(:start) AS INTEGER), :last_day),
+           {price}
+    FROM {table}
+    WHERE competitor_id = :competitor_id
+      AND {first} <= :end
+      AND {last} >= :start{since}
+"""
+# Уровни хранения (см. retention.py) от самого грубого к сырым записям:
+# дни старше RAW_RETENTION_DAYS есть только в агрегатах, за день берётся
+# price_last, недельный агрегат растягивается на всю неделю. У сырых записей
+# интервал date..valid_to может быть любой длины, нижней границы для date нет.
+PRICE_SOURCES = (
+    {"table": "price_rollups_weekly", "first": "period_start",
+     "last": "date(period_start, '+6 days')", "price": "price_last",
+     "since": "\n      AND period_start >= date(:start, '-6 days')"},
+    {"table": "price_rollups_daily", "first": "period_start",
+     "last": "period_start", "price": "price_last", "since": ""},
+    {"table": "price_records", "first": "date",
+     "last": "COALESCE(valid_to, date)", "price": "price", "since": ""},
+)
+PRICE_ROW_DTYPE = np.dtype([("id", np.int64), ("packed", np.int64), ("price", np.float32)])
+
+
+def _fetch_price_rows(conn, sql: str, params: dict) -> np.ndarray:
+    # строки читаются сырым курсором сразу в типизированный массив — без
+    # Row-объектов и разбора дат в Python
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = np.fromiter(cursor, dtype=PRICE_ROW_DTYPE)
+    finally:
+        cursor.close()
+    return rows[np.lexsort((rows["id"],))]
+
+
+def load_price_matrix(conn, competitor_id: int, start: date, end: date):
+    """Загружает цены конкурента за [start, end] в матрицу float32 «товар × день».
+
+    Возвращает (product_ids, matrix); там, где цены за день нет, стоит NaN.
+    Интервалы date..valid_to разворачиваются по дням; если на день приходится
+    несколько записей, остаётся последняя по id. Дни, уже свёрнутые
+    retention.py, берутся из дневных и недельных агрегатов.
+    """
+    n_days = (end - start).days + 1
+    if n_days > 0xFFFF:
+        raise ValueError("window is too long")
+    params = {
+        "competitor_id": competitor_id, "start": start.isoformat(),
+        "end": end.isoformat(), "last_day": n_days - 1,
+    }
+    # более детальный уровень идёт позже и перезаписывает пересекающиеся дни
+    rows = np.concatenate([
+        _fetch_price_rows(conn, LOAD_PRICES_SQL.format(**source), params)
+        for source in PRICE_SOURCES
+    ])
+    if not len(rows):
+        return np.empty(0, dtype=np.int64), np.empty((0, n_days), dtype=np.float32)
+
+    pids   = rows["packed"] >> 32
+    firsts = (rows["packed"] >> 16) & 0xFFFF
+    lasts  = rows["packed"] & 0xFFFF
+
+    rec, days = expand_intervals(firsts, lasts)
+
+    product_ids, row_idx = np.unique(pids, return_inverse=True)
+    cells = row_idx[rec] * n_days + days
+    # в одну клетку может попасть несколько записей — остаётся последняя
+    # (уровни идут от агрегатов к сырым, внутри уровня — по id). При повторных
+    # индексах NumPy не гарантирует, какое присваивание победит, поэтому
+    # последнее вхождение каждой клетки выбираем явно.
+    _, last_seen = np.unique(cells[::-1], return_index=True)
+    keep = len(cells) - 1 - last_seen
+    matrix = np.full((len(product_ids), n_days), np.nan, dtype=np.float32)
+    matrix.flat[cells[keep]] = rows["price"][rec[keep]]
+    return product_ids, matrix
+
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Протягивает последнюю известную цену вправо по дням."""
+    if matrix.size == 0:
+        return matrix.copy()
+    idx = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return matrix[np.arange(matrix.shape[0])[:, None], idx]
+
+
+def trailing_mean(matrix: np.ndarray, window: int) -> np.ndarray:
+    """Среднее за последние window дней каждой строки с пропуском NaN."""
+    tail  = matrix[:, -window:]
+    valid = ~np.isnan(tail)
+    sums  = np.where(valid, tail, 0).sum(axis=1, dtype=np.float64)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, sums / count, np.nan)
+
+
+def change_pct(prev: np.ndarray, cur: np.ndarray) -> np.ndarray:
+    """Изменение цены в процентах; NaN, если предыдущей цены нет."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(prev > 0, (cur - prev) / prev * 100.0, np.nan)
+
+
+def percentile_rank(matrix: np.ndarray, cur: np.ndarray) -> np.ndarray:
+    """Доля дней окна (в %), когда цена была не выше текущей."""
+    valid = ~np.isnan(matrix)
+    below = (matrix <= cur[:, None]) & valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return below.sum(axis=1) / valid.sum(axis=1) * 100.0
+
+
+# ----------------------------
+# Расчёт и сохранение метрик
+# ----------------------------
+
+def _competitor_metrics(conn, competitor_id: int, start: date, end: date) -> dict:
+    product_ids, matrix = load_price_matrix(conn, competitor_id, start, end)
+    filled = forward_fill(matrix)
+    cur    = filled[:, -1]
+    prev   = filled[:, -2] if filled.shape[1] > 1 else np.full_like(cur, np.nan)
+    return {
+        "product_ids":     product_ids,
+        "price":           cur,
+        "change_pct":      change_pct(prev, cur),
+        "rolling_avg":     trailing_mean(matrix, ROLLING_WINDOW),
+        "percentile_rank": percentile_rank(matrix, cur),
+    }
+
+
+def _price_index(per_competitor: dict) -> dict:
+    """Индекс цены: цена конкурента к средней цене по всем конкурентам × 100."""
+    all_ids = np.unique(np.concatenate(
+        [m["product_ids"] for m in per_competitor.values()] or [np.empty(0, dtype=np.int64)]
+    ))
+    grid = np.full((len(per_competitor), len(all_ids)), np.nan, dtype=np.float64)
+    for i, m in enumerate(per_competitor.values()):
+        grid[i, np.searchsorted(all_ids, m["product_ids"])] = m["price"]
+
+    valid = ~np.isnan(grid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean  = np.where(valid, grid, 0).sum(axis=0) / valid.sum(axis=0)
+        index = grid / mean * 100.0
+
+    return {
+        cid: index[i, np.searchsorted(all_ids, m["product_ids"])]
+        for i, (cid, m) in enumerate(per_competitor.items())
+    }
+
+
+def _nullable(values: np.ndarray) -> list:
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+
+def _compute_price_metrics_sync(as_of: date, window_days: int) -> AnalyticsSummary:
+    started = time.perf_counter()
+    start = as_of - timedelta(days=window_days - 1)
+
+    with engine.begin() as conn:
+        comp_ids = [r[0] for r in conn.execute(select(competitors.c.id)).fetchall()]
+        per_competitor = {cid: _competitor_metrics(conn, cid, start, as_of) for cid in comp_ids}
+        indexes = _price_index(per_competitor)
+
+        conn.execute(price_metrics.delete().where(price_metrics.c.date == as_of))
+        stored, changes = 0, []
+        for cid, m in per_competitor.items():
+            has_price = ~np.isnan(m["price"])
+            columns = zip(
+                m["product_ids"][has_price].tolist(),
+                m["price"][has_price].astype(np.float64).round(2).tolist(),
+                _nullable(m["change_pct"][has_price]),
+                _nullable(m["rolling_avg"][has_price]),
+                _nullable(m["percentile_rank"][has_price]),
+                _nullable(indexes[cid][has_price]),
+            )
+            batch = [
+                {
+                    "product_id": pid, "competitor_id": cid, "date": as_of, "price": price,
+                    "change_pct": chg, "rolling_avg": avg, "percentile_rank": rank, "price_index": idx,
+                }
+                for pid, price, chg, avg, rank, idx in columns
+            ]
+            for i in range(0, len(batch), INSERT_BATCH):
+                conn.execute(price_metrics.insert(), batch[i:i + INSERT_BATCH])
+            stored += len(batch)
+            changes.append(m["change_pct"][has_price])
+
+    all_changes = np.concatenate(changes) if changes else np.empty(0)
+    all_changes = all_changes[~np.isnan(all_changes)]
+    p05, p50, p95 = (
+        np.percentile(all_changes, [5, 50, 95]).round(4).tolist()
+        if all_changes.size else (None, None, None)
+    )
+
+    return AnalyticsSummary(
+        date=as_of,
+        window_days=window_days,
+        products=len(set().union(*(m["product_ids"].tolist() for m in per_competitor.values()))),
+        competitors=len(comp_ids),
+        metrics_stored=stored,
+        change_p05=p05,
+        change_p50=p50,
+        change_p95=p95,
+        elapsed_sec=round(time.perf_counter() - started, 3),
+    )
+
+
+async def compute_price_metrics(as_of: Optional[date] = None, window_days: int = WINDOW_DAYS) -> AnalyticsSummary:
+    """Пересчитывает метрики на дату as_of и сохраняет их в price_metrics."""
+    if window_days < 2:
+        raise HTTPException(status_code=400, detail="window_days must be >= 2")
+    as_of = as_of or date.today()
+    # расчёт синхронный и CPU-bound — уводим из event loop
+    return await asyncio.to_thread(_compute_price_metrics_sync, as_of, window_days)
+
+
+# ----------------------------
+# Чтение метрик
+# ----------------------------
+
+async def get_latest_metrics_date() -> Optional[date]:
+    return await database.fetch_val(select(func.max(price_metrics.c.date)))
+
+
+async def get_price_movers(
+    threshold_pct: float,
+    day: Optional[date] = None,
+    competitor_id: Optional[int] = None,
+    limit: int = 100,
+) -> list[PriceMetric]:
+    """Товары, цена которых изменилась больше чем на threshold_pct % ко вчера."""
+    day = day or await get_latest_metrics_date()
+    if day is None:
+        return []
+    query = (
+        price_metrics.select()
+        .where(price_metrics.c.date == day)
+        .where(func.abs(price_metrics.c.change_pct) >= threshold_pct)
+        .order_by(func.abs(price_metrics.c.change_pct).desc())
+        .limit(limit)
+    )
+    if competitor_id is not None:
+        query = query.where(price_metrics.c.competitor_id == competitor_id)
+    rows = await database.fetch_all(query)
+    return [PriceMetric(**r) for r in rows]
+
+
+# ----------------------------
+# Правила алертов
+# ----------------------------
+
+async def create_alert_rule(rule_in: AlertRuleCreate) -> AlertRule:
+    exists = await database.fetch_one(alert_rules.select().where(alert_rules.c.name == rule_in.name))
+    if exists:
+        raise HTTPException(status_code=400, detail="Alert rule name already exists")
+    rule_id = await database.execute(alert_rules.insert().values(**rule_in.model_dump()))
+    row = await database.fetch_one(alert_rules.select().where(alert_rules.c.id == rule_id))
+    return AlertRule(**row)
+
+
+async def get_alert_rules() -> list[AlertRule]:
+    rows = await database.fetch_all(alert_rules.select())
+    return [AlertRule(**r) for r in rows]
+
+
+async def delete_alert_rule(rule_id: int) -> None:
+    await database.execute(alert_rules.delete().where(alert_rules.c.id == rule_id))
+
+
+async def evaluate_alerts(day: Optional[date] = None) -> list[PriceAlert]:
+    """Сопоставляет метрики за день со всеми правилами одним запросом."""
+    day = day or await get_latest_metrics_date()
+    if day is None:
+        return []
+    m, r = price_metrics.c, alert_rules.c
+    triggered = or_(
+        and_(r.direction == "up",   m.change_pct >= r.threshold_pct),
+        and_(r.direction == "down", m.change_pct <= -r.threshold_pct),
+        and_(r.direction == "any",  func.abs(m.change_pct) >= r.threshold_pct),
+    )
+    joined = price_metrics.join(
+        alert_rules, or_(r.competitor_id.is_(None), r.competitor_id == m.competitor_id)
+    )
+    rows = await database.fetch_all(
+        select(price_metrics, r.id.label("rule_id"), r.name.label("rule_name"))
+        .select_from(joined)
+        .where(m.date == day)
+        .where(triggered)
+        .order_by(r.id, func.abs(m.change_pct).desc())
+    )
+    return [PriceAlert(**row) for row in rows]
+
+
+if __name__ == "__main__":
+    # запуск по расписанию (cron): python analytics.py
+    print(asyncio.run(compute_price_metrics()))
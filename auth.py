@@ -0,0 +1,92 @@
+# auth.py
+# JWT-аутентификация и зависимости require_user / require_admin.
+# Вынесены из main.py, чтобы их могли подключать и роутеры из routes/.
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from pydantic import BaseModel
+from sqlalchemy import select
+
+from database import database
+from models import users
+
+# ----------------------------
+# JWT и безопасность
+# ----------------------------
+SECRET_KEY = os.getenv("SECRET_KEY", "change-me")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
+pwd_context    = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# ----------------------------
+# Pydantic-схемы
+# ----------------------------
+class Token(BaseModel):
+    access_token: str
+    token_type:   str
+
+class TokenData(BaseModel):
+    username: Optional[str] = None
+    role:     Optional[str] = None
+
+class User(BaseModel):
+    username: str
+    role:     str
+
+class UserInDB(User):
+    hashed_password: str
+
+# ----------------------------
+# Утилиты аутентификации
+# ----------------------------
+async def get_user(username: str) -> Optional[UserInDB]:
+    row = await database.fetch_one(
+        select(users).where(users.c.username == username)
+    )
+    return UserInDB(**row) if row else None
+
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+    user = await get_user(username)
+    if not user or not pwd_context.verify(password, user.hashed_password):
+        return None
+    return user
+
+def create_access_token(data: Dict[str,str], expires_delta: Optional[timedelta]=None):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    exc = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate":"Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        role:     str = payload.get("role")
+        if username is None or role is None:
+            raise exc
+    except JWTError:
+        raise exc
+    user = await get_user(username)
+    if not user:
+        raise exc
+    return User(username=user.username, role=user.role)
+
+async def require_user(user: User = Depends(get_current_user)): return user
+
+async def require_admin(user: User = Depends(get_current_user)):
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return user
@@ -0,0 +1,48 @@
+# bench_startup.py
+# Замер холодного старта API: время `import main` в чистом процессе,
+# пиковая память и список тяжёлых модулей, попавших в процесс.
+#   python bench_startup.py [кол-во прогонов]
+
+import json
+import statistics
+import subprocess
+import sys
+
+# Эти модули не должны загружаться при старте API
+HEAVY_MODULES = ["selenium", "undetected_chromedriver", "numpy", "redis", "requests"]
+
+PROBE = f"""
+import json, resource, sys, time
+t = time.perf_counter()
+import main
+elapsed = time.perf_counter() - t
+print(json.dumps({{
+    "import_sec": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def run_once() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs: int = 5) -> None:
+    results = [run_once() for _ in range(runs)]
+    times = [r["import_sec"] for r in results]
+    print(f"import main: медиана {statistics.median(times) * 1000:.0f} мс, "
+          f"мин {min(times) * 1000:.0f} мс, макс {max(times) * 1000:.0f} мс ({runs} прогонов)")
+    print(f"пиковая память: {max(r['max_rss_mb'] for r in results):.1f} МБ")
+    print(f"загружено модулей: {results[-1]['modules']}")
+    heavy = results[-1]["heavy"]
+    print("тяжёлые модули при старте:", ", ".join(heavy) if heavy else "нет")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,102 @@
+# compaction.py
+# Сжатие истории цен: подряд идущие (без пропущенных дней) записи одного товара
+# у одного конкурента с одинаковой ценой сливаются в одну запись с интервалом
+# date..valid_to.
+# Нужен для данных, накопленных в режиме "append" (см. crud.PRICE_STORAGE_MODE).
+
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import select, cast, func, String, bindparam
+
+from database import engine
+from models import price_records
+from price_history import delete_ids
+
+# ========== НАСТРОЙКИ ==========
+PRODUCT_CHUNK = 5000     # сколько товаров обрабатываем за один проход
+# ================================
+
+
+def _compact_chunk(conn, first_pid: int, last_pid: int) -> tuple[int, int]:
+    pr = price_records.c
+    rows = conn.execute(
+        select(
+            pr.id, pr.product_id, pr.competitor_id, pr.price,
+            cast(pr.date, String), cast(func.coalesce(pr.valid_to, pr.date), String),
+        )
+        .where(pr.product_id.between(first_pid, last_pid))
+        .order_by(pr.product_id, pr.competitor_id, pr.date, pr.id)
+    ).fetchall()
+    if len(rows) < 2:
+        return 0, 0
+
+    ids, pids, cids, prices, dates, valid_to = zip(*rows)
+    ids    = np.fromiter(ids, dtype=np.int64, count=len(rows))
+    pids   = np.fromiter(pids, dtype=np.int64, count=len(rows))
+    cids   = np.fromiter(cids, dtype=np.int64, count=len(rows))
+    prices = np.fromiter(prices, dtype=np.float64, count=len(rows))
+    dates    = np.array(dates, dtype="datetime64[D]")
+    valid_to = np.array(valid_to, dtype="datetime64[D]")
+
+    # запись продолжает серию, если товар, конкурент и цена те же, что у предыдущей,
+    # и между ними нет пропущенных дней (иначе интервал выдумал бы цены на пропуск)
+    continues = np.zeros(len(rows), dtype=bool)
+    continues[1:] = (
+        (pids[1:] == pids[:-1]) & (cids[1:] == cids[:-1]) & (prices[1:] == prices[:-1])
+        & (dates[1:] <= valid_to[:-1] + np.timedelta64(1, "D"))
+    )
+    starts = np.flatnonzero(~continues)
+    run_len = np.diff(np.append(starts, len(rows)))
+
+    merged = run_len > 1
+    if not merged.any():
+        return 0, 0
+    keep_ids = ids[starts][merged]
+    run_end  = np.maximum.reduceat(valid_to, starts)[merged]
+    drop_ids = ids[continues]
+
+    conn.execute(
+        price_records.update()
+        .where(pr.id == bindparam("keep_id"))
+        .values(valid_to=bindparam("run_end")),
+        [
+            {"keep_id": k, "run_end": e}
+            for k, e in zip(keep_ids.tolist(), run_end.astype(object).tolist())
+        ],
+    )
+    delete_ids(conn, price_records, drop_ids.tolist())
+    return len(keep_ids), len(drop_ids)
+
+
+def compact_price_records() -> dict:
+    """Сливает повторяющиеся цены во всей таблице price_records."""
+    started = time.perf_counter()
+    merged = deleted = 0
+    with engine.connect() as conn:
+        lo, hi = conn.execute(select(func.min(price_records.c.product_id), func.max(price_records.c.product_id))).one()
+    if lo is None:
+        return {"merged_runs": 0, "deleted_rows": 0, "elapsed_sec": 0.0}
+
+    for first in range(lo, hi + 1, PRODUCT_CHUNK):
+        # каждый кусок — отдельная транзакция, чтобы не держать блокировку на всю таблицу
+        with engine.begin() as conn:
+            m, d = _compact_chunk(conn, first, first + PRODUCT_CHUNK - 1)
+        merged += m
+        deleted += d
+
+    return {
+        "merged_runs": merged,
+        "deleted_rows": deleted,
+        "elapsed_sec": round(time.perf_counter() - started, 3),
+    }
+
+
+async def run_compaction() -> dict:
+    return await asyncio.to_thread(compact_price_records)
+
+
+if __name__ == "__main__":
+    # разовый запуск / cron: python compaction.py
+    print(compact_price_records())
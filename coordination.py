@@ -0,0 +1,238 @@
+# coordination.py
+# Координация нескольких worker.py через Redis:
+#   * регистрация воркеров и heartbeat (ключ worker:<id> живёт WORKER_TTL сек);
+#   * аренда задач: задача из очереди атомарно переносится в список
+#     «в работе» и получает lease:<task> с TTL; если воркер умер и аренду
+#     никто не продлил, задача возвращается в очередь. Задача — это токен
+#     "<product_id>:<uuid>", поэтому один товар, поставленный дважды, —
+#     две независимые аренды;
+#   * счётчики поставленных и выполненных задач и занятого времени воркеров
+#     по минутам — из них считаются пропускная способность, ETA очереди и
+#     нужное число воркеров (по средней длительности задачи, а не по тому,
+#     сколько задач пришло).
+
+import math
+import os
+import socket
+import time
+import uuid
+
+QUEUE_KEY      = "price_tasks"
+PROCESSING_KEY = "price_tasks:processing"
+WORKERS_KEY    = "workers"
+WORKER_PREFIX  = "worker:"
+LEASE_PREFIX   = "lease:"
+DONE_PREFIX    = "stats:done:"       # + минута; выполненные задачи
+ENQUEUED_PREFIX = "stats:enqueued:"  # + минута; поставленные задачи
+BUSY_PREFIX    = "stats:busy:"       # + минута; секунды, потраченные на задачи
+
+# ========== НАСТРОЙКИ ==========
+HEARTBEAT_INTERVAL = 5      # сек
+WORKER_TTL         = 20     # сек без heartbeat — воркер считается мёртвым
+LEASE_TTL          = 90     # сек; продлевается каждым heartbeat
+RECLAIM_INTERVAL   = 30     # сек; как часто воркеры ищут брошенные задачи
+RATE_WINDOW_MIN    = 5      # по скольким минутам считаем скорость
+STATS_TTL          = 3600
+TARGET_DRAIN_SEC   = int(os.getenv("TARGET_DRAIN_SEC", "600"))   # за сколько хотим разгребать очередь
+DEFAULT_TASK_SEC   = float(os.getenv("DEFAULT_TASK_SEC", "30"))  # оценка, пока нет статистики
+MIN_WORKERS        = int(os.getenv("MIN_WORKERS", "1"))
+MAX_WORKERS        = int(os.getenv("MAX_WORKERS", "10"))
+# ================================
+
+# LMOVE + аренда одним атомарным шагом, чтобы задача не оказалась
+# «в работе» без аренды (её бы сразу вернули в очередь)
+CLAIM_SCRIPT = """
+local task = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+if task then
+    redis.call('SET', ARGV[1] .. task, ARGV[2], 'EX', ARGV[3])
+end
+return task
+"""
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _minute(ts=None) -> int:
+    return int((ts or time.time()) // 60)
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def new_task(product_id: int) -> str:
+    return f"{product_id}:{uuid.uuid4().hex[:12]}"
+
+
+def task_product_id(task) -> int:
+    """product_id из токена задачи (старые задачи в очереди — просто id)."""
+    return int(_text(task).split(":", 1)[0])
+
+
+# ----------------------------
+# Постановка задач
+# ----------------------------
+
+async def enqueue_tasks(r, product_ids: list[int], batch: int = 1000) -> int:
+    for i in range(0, len(product_ids), batch):
+        await r.rpush(QUEUE_KEY, *map(new_task, product_ids[i:i + batch]))
+    if product_ids:
+        key = f"{ENQUEUED_PREFIX}{_minute()}"
+        await r.incrby(key, len(product_ids))
+        await r.expire(key, STATS_TTL)
+    return len(product_ids)
+
+
+# ----------------------------
+# Воркер
+# ----------------------------
+
+async def register_worker(r, worker_id: str) -> None:
+    key = WORKER_PREFIX + worker_id
+    host, pid, _ = worker_id.rsplit(":", 2)
+    now = time.time()
+    await r.hset(key, mapping={
+        "host": host, "pid": pid, "started_at": now, "last_seen": now,
+        "status": "idle", "task": "", "processed": 0, "failed": 0,
+    })
+    await r.expire(key, WORKER_TTL)
+    await r.sadd(WORKERS_KEY, worker_id)
+
+
+async def unregister_worker(r, worker_id: str) -> None:
+    await r.delete(WORKER_PREFIX + worker_id)
+    await r.srem(WORKERS_KEY, worker_id)
+
+
+async def heartbeat(r, worker_id: str, task=None) -> None:
+    """Продлевает жизнь воркера и аренду текущей задачи."""
+    key = WORKER_PREFIX + worker_id
+    pipe = r.pipeline()
+    pipe.hset(key, "last_seen", time.time())
+    pipe.expire(key, WORKER_TTL)
+    if task is not None:
+        pipe.expire(LEASE_PREFIX + _text(task), LEASE_TTL)
+    await pipe.execute()
+
+
+async def claim_task(r, worker_id: str):
+    task = await r.eval(CLAIM_SCRIPT, 2, QUEUE_KEY, PROCESSING_KEY, LEASE_PREFIX, worker_id, LEASE_TTL)
+    if task is not None:
+        await r.hset(WORKER_PREFIX + worker_id, mapping={
+            "status": "busy", "task": _text(task), "claimed_at": time.time(),
+        })
+    return task
+
+
+async def complete_task(r, worker_id: str, task, ok: bool) -> None:
+    claimed_at = await r.hget(WORKER_PREFIX + worker_id, "claimed_at")
+    pipe = r.pipeline()
+    pipe.lrem(PROCESSING_KEY, 1, task)
+    pipe.delete(LEASE_PREFIX + _text(task))
+    pipe.hincrby(WORKER_PREFIX + worker_id, "processed" if ok else "failed", 1)
+    pipe.hset(WORKER_PREFIX + worker_id, mapping={"status": "idle", "task": "", "claimed_at": ""})
+    minute = _minute()
+    done_key = f"{DONE_PREFIX}{minute}"
+    pipe.incr(done_key)
+    pipe.expire(done_key, STATS_TTL)
+    if claimed_at:
+        busy_key = f"{BUSY_PREFIX}{minute}"
+        pipe.incrbyfloat(busy_key, max(0.0, time.time() - float(claimed_at)))
+        pipe.expire(busy_key, STATS_TTL)
+    await pipe.execute()
+
+
+async def reclaim_expired(r) -> int:
+    """Возвращает в начало очереди задачи, чья аренда истекла."""
+    reclaimed = 0
+    for task in set(await r.lrange(PROCESSING_KEY, 0, -1)):
+        if await r.exists(LEASE_PREFIX + _text(task)):
+            continue
+        # LREM вернёт 0, если задачу уже забрал другой воркер
+        if await r.lrem(PROCESSING_KEY, 1, task):
+            await r.lpush(QUEUE_KEY, task)
+            reclaimed += 1
+    return reclaimed
+
+
+# ----------------------------
+# Состояние кластера
+# ----------------------------
+
+async def _window_total(r, prefix: str) -> float:
+    """Сумма счётчика за RATE_WINDOW_MIN последних полных минут."""
+    now = _minute()
+    keys = [f"{prefix}{m}" for m in range(now - RATE_WINDOW_MIN, now)]
+    return sum(float(v) for v in await r.mget(keys) if v)
+
+
+async def _rate_per_sec(r, prefix: str) -> float:
+    """Средняя скорость за RATE_WINDOW_MIN последних полных минут."""
+    return await _window_total(r, prefix) / (RATE_WINDOW_MIN * 60)
+
+
+async def _avg_task_sec(r):
+    """Средняя длительность задачи за окно или None, если замеров нет."""
+    done = await _window_total(r, DONE_PREFIX)
+    busy = await _window_total(r, BUSY_PREFIX)
+    return busy / done if done and busy else None
+
+
+async def list_workers(r) -> list[dict]:
+    workers = []
+    for worker_id in sorted(_text(w) for w in await r.smembers(WORKERS_KEY)):
+        info = {_text(k): _text(v) for k, v in (await r.hgetall(WORKER_PREFIX + worker_id)).items()}
+        if not info:
+            # heartbeat пропал — воркер умер, не попрощавшись
+            await r.srem(WORKERS_KEY, worker_id)
+            continue
+        workers.append({
+            "id": worker_id,
+            "host": info.get("host"),
+            "pid": int(info.get("pid", 0)),
+            "status": info.get("status"),
+            "task": info.get("task") or None,
+            "processed": int(info.get("processed", 0)),
+            "failed": int(info.get("failed", 0)),
+            "started_at": float(info.get("started_at", 0)),
+            "last_seen_sec_ago": round(time.time() - float(info.get("last_seen", 0)), 1),
+        })
+    return workers
+
+
+def desired_worker_count(backlog: int, enqueue_rate: float, task_sec=None) -> int:
+    """Сколько воркеров нужно, чтобы успевать за входящим потоком и
+    разобрать текущую очередь за TARGET_DRAIN_SEC.
+
+    Производительность воркера — 1 / task_sec (средняя длительность задачи,
+    без статистики — DEFAULT_TASK_SEC), а не done_rate / alive: в равновесии
+    done_rate равен входящему потоку, и воркеров никогда не становилось бы меньше.
+    """
+    per_worker = 1 / (task_sec or DEFAULT_TASK_SEC)
+    needed = (enqueue_rate + backlog / TARGET_DRAIN_SEC) / per_worker
+    return max(MIN_WORKERS, min(MAX_WORKERS, math.ceil(needed)))
+
+
+async def cluster_status(r) -> dict:
+    workers = await list_workers(r)
+    backlog = await r.llen(QUEUE_KEY)
+    in_flight = await r.llen(PROCESSING_KEY)
+    enqueue_rate = await _rate_per_sec(r, ENQUEUED_PREFIX)
+    done_rate = await _rate_per_sec(r, DONE_PREFIX)
+    task_sec = await _avg_task_sec(r)
+    drain_rate = done_rate - enqueue_rate
+    return {
+        "workers": workers,
+        "alive": len(workers),
+        "backlog": backlog,
+        "in_flight": in_flight,
+        "enqueued_per_min": round(enqueue_rate * 60, 2),
+        "done_per_min": round(done_rate * 60, 2),
+        "avg_task_sec": round(task_sec, 1) if task_sec else None,
+        "queue_growing": enqueue_rate > done_rate,
+        # очередь растёт быстрее, чем разбирается, — ETA нет
+        "backlog_eta_sec": round(backlog / drain_rate) if drain_rate > 0 else None,
+        "desired_workers": desired_worker_count(backlog, enqueue_rate, task_sec),
+    }
@@ -1,10 +1,27 @@
 # crud.py
-from datetime import datetime
+import asyncio
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
 from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from database import database
-from models import products, competitors, price_records
-from schemas import ProductCreate, Product, CompetitorCreate, Competitor, PriceRecordCreate, PriceRecord
+from events import notify_price_stored
+from models import products, competitors, price_records, price_rollups_daily, price_rollups_weekly
+from schemas import (
+    ProductCreate, Product, ProductBulkResult, CompetitorCreate, Competitor,
+    PriceRecordCreate, PriceRecord, PriceHistoryPoint,
+)
 
+# "changes" — храним только изменения цены: неизменная цена продлевает
+# интервал date..valid_to последней записи; "append" — пишем каждую выборку.
+PRICE_STORAGE_MODE = os.getenv("PRICE_STORAGE_MODE", "changes")
+
+BULK_BATCH = 500  # названий в одном INSERT (держимся в лимите параметров SQLite)
 
 # ----------------------------
 # CRUD для Products
@@ -29,6 +46,82 @@ async def get_products(skip: int = 0, limit: int = 100) -> list[Product]:
     return [Product(**r) for r in rows]
 
 
+def normalize_product_name(name: str) -> str:
+    return " ".join(name.split())
+
+
+# заголовки колонки с названием товара в CSV (без учёта регистра)
+NAME_COLUMNS = ("name", "query", "название", "наименование", "товар")
+
+
+def parse_product_names(filename: str, content: bytes) -> list[str]:
+    """Названия товаров из загруженного файла.
+
+    JSON — список строк или объектов с полем "name". CSV — колонка из
+    NAME_COLUMNS; файл из одной колонки без такого заголовка читается целиком
+    как список названий. В CSV из нескольких колонок без колонки названия
+    нельзя понять, заголовок ли первая строка, — это ошибка.
+    Любая ошибка разбора — ValueError.
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if not isinstance(data, list):
+            raise ValueError("JSON должен быть списком названий")
+        names = [x.get("name") if isinstance(x, dict) else x for x in data]
+        for i, name in enumerate(names, 1):
+            if not isinstance(name, str):
+                raise ValueError(f"элемент {i}: название должно быть строкой")
+        return names
+
+    try:
+        rows = [r for r in csv.reader(io.StringIO(text)) if r]
+    except csv.Error as e:
+        raise ValueError(f"CSV: {e}")
+    if not rows:
+        return []
+    header = [h.strip().lower() for h in rows[0]]
+    for col in NAME_COLUMNS:
+        if col in header:
+            idx = header.index(col)
+            return [r[idx] for r in rows[1:] if len(r) > idx]
+    if max(len(r) for r in rows) > 1:
+        raise ValueError(f"в CSV нет колонки с названием ({', '.join(NAME_COLUMNS)})")
+    return [r[0] for r in rows]
+
+
+async def bulk_create_products(names: list[str]) -> ProductBulkResult:
+    """Массово создаёт товары, пропуская уже существующие названия.
+
+    Дедупликация против уникального индекса products.name делается самой
+    базой: INSERT ... ON CONFLICT DO NOTHING RETURNING возвращает только
+    реально вставленные строки, по одному запросу на пачку.
+    """
+    normalized = [n for n in (normalize_product_name(x) for x in names) if n]
+    unique = list(dict.fromkeys(normalized))
+
+    created, skipped = [], []
+    async with database.transaction():
+        for i in range(0, len(unique), BULK_BATCH):
+            batch = unique[i:i + BULK_BATCH]
+            query = (
+                sqlite_insert(products)
+                .values([{"name": n} for n in batch])
+                .on_conflict_do_nothing(index_elements=["name"])
+                .returning(products.c.id, products.c.name, products.c.sku)
+            )
+            rows = await database.fetch_all(query)
+            inserted = {r["name"] for r in rows}
+            created += [Product(**r) for r in rows]
+            skipped += [n for n in batch if n not in inserted]
+
+    return ProductBulkResult(
+        created=created,
+        skipped=skipped,
+        duplicates_in_input=len(normalized) - len(unique),
+    )
+
+
 # ----------------------------
 # CRUD для Competitors
 # ----------------------------
@@ -61,10 +154,11 @@ async def create_price_record(record_in: PriceRecordCreate) -> PriceRecord:
     await get_product(record_in.product_id)
     await get_competitor(record_in.competitor_id)
 
-    query = price_records.insert().values(**record_in.model_dump())
-    record_id = await database.execute(query)
-    row = await database.fetch_one(price_records.select().where(price_records.c.id == record_id))
-    return PriceRecord(**row)
+    # та же запись, что и из парсера: с учётом PRICE_STORAGE_MODE
+    record, created = await store_price(record_in.product_id, record_in.competitor_id, record_in.price, record_in.date)
+    if created:
+        await notify_price_stored(record)
+    return record
 
 
 async def get_price_record(record_id: int) -> PriceRecord:
@@ -74,9 +168,171 @@ async def get_price_record(record_id: int) -> PriceRecord:
     return PriceRecord(**row)
 
 
+def expand_daily(rows) -> list[PriceRecord]:
+    """Разворачивает интервалы date..valid_to в подневный ряд цен."""
+    result = []
+    for r in rows:
+        rec = PriceRecord(**r)
+        day, last = rec.date, rec.valid_to or rec.date
+        while day <= last:
+            result.append(rec.model_copy(update={"date": day, "valid_to": None}))
+            day += timedelta(days=1)
+    return result
+
+
+async def get_latest_prices(product_ids: list[int]) -> dict[int, dict[int, PriceRecord]]:
+    """Последняя цена каждого конкурента для товаров: {product_id: {competitor_id: PriceRecord}}."""
+    if not product_ids:
+        return {}
+    pr = price_records.c
+    latest = (
+        select(func.max(pr.id).label("id"))
+        .where(pr.product_id.in_(product_ids))
+        .group_by(pr.product_id, pr.competitor_id)
+        .subquery()
+    )
+    rows = await database.fetch_all(
+        price_records.select().join(latest, latest.c.id == pr.id)
+    )
+    result: dict[int, dict[int, PriceRecord]] = {}
+    for r in rows:
+        result.setdefault(r["product_id"], {})[r["competitor_id"]] = PriceRecord(**r)
+    return result
+
+
 async def get_price_records_by_product(product_id: int) -> list[PriceRecord]:
-    rows = await database.fetch_all(price_records.select().where(price_records.c.product_id == product_id))
-    return [PriceRecord(**r) for r in rows]
+    """Вся история товара: сырые записи по дням, а то, что уже свёрнуто
+    retention.py, — по одной точке на день или неделю из агрегатов
+    (цена на конец периода, id = None)."""
+    rows = await database.fetch_all(
+        price_records.select()
+        .where(price_records.c.product_id == product_id)
+        .order_by(price_records.c.competitor_id, price_records.c.date, price_records.c.id)
+    )
+    result = expand_daily(rows)
+    for table in (price_rollups_weekly, price_rollups_daily):
+        c = table.c
+        rollups = await database.fetch_all(
+            select(c.product_id, c.competitor_id, c.price_last, c.period_start)
+            .where(c.product_id == product_id)
+        )
+        result += [
+            PriceRecord(
+                id=None, product_id=r["product_id"], competitor_id=r["competitor_id"],
+                price=r["price_last"], date=r["period_start"],
+            )
+            for r in rollups
+        ]
+    # сортировка устойчивая: внутри дня сырые записи остаются в порядке id
+    return sorted(result, key=lambda rec: (rec.competitor_id, rec.date))
+
+
+async def get_price_history(
+    product_id: int,
+    start: date,
+    end: date,
+    competitor_id: Optional[int] = None,
+) -> list[PriceHistoryPoint]:
+    """История цен за [start, end] в разрешении, подобранном по диапазону.
+
+    Недавние дни берутся из price_records, более старые — из дневных и
+    недельных агрегатов (см. retention.py); всё сводится к одному разрешению.
+    """
+    from retention import choose_resolution, aggregate_raw, aggregate_rollups, as_rows, week_start
+
+    resolution = choose_resolution(start, end)
+    pr = price_records.c
+    valid_to = func.coalesce(pr.valid_to, pr.date)
+    query = (
+        select(pr.id, pr.product_id, pr.competitor_id, pr.price, pr.date, valid_to.label("valid_to"))
+        .where(pr.product_id == product_id)
+        .where(pr.date <= end)
+        .where(valid_to >= start)
+    )
+    if competitor_id is not None:
+        query = query.where(pr.competitor_id == competitor_id)
+    raw = await database.fetch_all(query)
+
+    points = []
+    if raw:
+        clipped = [
+            (r["id"], r["product_id"], r["competitor_id"], r["price"], max(r["date"], start), min(r["valid_to"], end))
+            for r in raw
+        ]
+        points += [tuple(p.values()) for p in as_rows(aggregate_raw(clipped, "daily"))]
+
+    if resolution != "raw":
+        for table, since in ((price_rollups_daily, start), (price_rollups_weekly, week_start(start))):
+            c = table.c
+            query = (
+                select(c.product_id, c.competitor_id, c.period_start, c.price_min,
+                       c.price_max, c.price_avg, c.price_last, c.samples)
+                .where(c.product_id == product_id)
+                .where(c.period_start.between(since, end))
+            )
+            if competitor_id is not None:
+                query = query.where(c.competitor_id == competitor_id)
+            points += [tuple(r.values()) for r in await database.fetch_all(query)]
+
+    if not points:
+        return []
+    merged = as_rows(aggregate_rollups(points, "weekly" if resolution == "weekly" else "daily"))
+    return [
+        PriceHistoryPoint(date=p.pop("period_start"), resolution=resolution, **p)
+        for p in merged
+    ]
+
+
+async def get_latest_price_record(product_id: int, competitor_id: int):
+    return await database.fetch_one(
+        price_records.select()
+        .where(price_records.c.product_id == product_id)
+        .where(price_records.c.competitor_id == competitor_id)
+        .order_by(price_records.c.date.desc(), price_records.c.id.desc())
+        .limit(1)
+    )
+
+
+def continues_interval(last, day: date) -> bool:
+    """day продолжает интервал записи last без пропущенных дней."""
+    last_day = last["valid_to"] or last["date"]
+    return last["date"] <= day <= last_day + timedelta(days=1)
+
+
+async def extend_price_record(last, day: date) -> PriceRecord:
+    """Продлевает интервал записи до day (не более одного UPDATE в день)."""
+    valid_to = max(day, last["valid_to"] or last["date"])
+    if valid_to != last["valid_to"]:
+        await database.execute(
+            price_records.update()
+            .where(price_records.c.id == last["id"])
+            .values(valid_to=valid_to)
+        )
+    return PriceRecord(**{**dict(last), "valid_to": valid_to})
+
+
+async def store_price(product_id: int, competitor_id: int, price: float, day: date) -> tuple[PriceRecord, bool]:
+    """Сохраняет цену с учётом PRICE_STORAGE_MODE.
+
+    В режиме "changes" та же цена, что и в последней записи, не создаёт новую
+    строку — у последней записи сдвигается valid_to. После пропуска (цену
+    несколько дней не снимали) пишется новая запись: интервал не должен
+    выдумывать цены на дни без наблюдений.
+    Возвращает (запись, created); created=False — продлён интервал старой записи.
+    """
+    if PRICE_STORAGE_MODE == "changes":
+        last = await get_latest_price_record(product_id, competitor_id)
+        if last and last["price"] == price and continues_interval(last, day):
+            return await extend_price_record(last, day), False
+
+    rec_in = PriceRecordCreate(
+        product_id=product_id,
+        competitor_id=competitor_id,
+        price=price,
+        date=day
+    )
+    record_id = await database.execute(price_records.insert().values(**rec_in.model_dump(), valid_to=day))
+    return PriceRecord(id=record_id, valid_to=day, **rec_in.model_dump()), True
 
 
 # ----------------------------
@@ -96,10 +352,17 @@ def search_product_urls(query):
 
 
 def parse_ozon_product(url: str):
-    from parsers.ozon_parser import init_driver, parse_product
+    """Парсит карточку и сверяет её с кэшем (parsers/scrape_cache.py).
+
+    Возвращает (info, хэш, cached_price); cached_price — цена, уже записанная
+    для того же содержимого карточки, или None.
+    """
+    from parsers.scrape_cache import get_scrape_cache
+    from parsers.ozon_parser import init_driver, parse_product_cached
+
     driver = init_driver()
     try:
-        result = parse_product(driver, url)
+        result = parse_product_cached(driver, url, get_scrape_cache())
         driver.quit()
         return result
     except Exception as e:
@@ -107,7 +370,14 @@ def parse_ozon_product(url: str):
         raise e
 
 
-async def create_price_record_from_ozon(product_id: int) -> PriceRecord:
+async def scrape_ozon_price(product_id: int) -> tuple[PriceRecord, bool]:
+    """Парсит цену товара на Ozon и сохраняет её.
+
+    Возвращает (запись, created); created=False — новой строки нет
+    (цена та же, продлён интервал последней записи).
+    """
+    from parsers.scrape_cache import get_scrape_cache
+
     # Получаем товар
     prod = await database.fetch_one(products.select().where(products.c.id == product_id))
     if not prod:
@@ -115,22 +385,42 @@ async def create_price_record_from_ozon(product_id: int) -> PriceRecord:
 
     name = prod["name"]
 
-    # Поиск ссылок на Ozon
-    urls = search_product_urls(name)
-    if not urls:
-        raise HTTPException(status_code=500, detail="Ozon: item not found")
+    # Получаем ID конкурента Ozon
+    comp = await database.fetch_one(competitors.select().where(competitors.c.name == "Ozon"))
+    if not comp:
+        raise HTTPException(status_code=500, detail="Competitor 'Ozon' missing")
+
+    # Браузер работает в отдельном потоке, чтобы не блокировать event loop
+    # (heartbeat воркера, другие запросы API).
+    # Парсим уже известную карточку; если её нет или она пропала — ищем заново
+    url, info = prod["url"], None
+    if url:
+        from parsers.ozon_parser import ProductPageMissing
+        try:
+            info, digest, cached_price = await asyncio.to_thread(parse_ozon_product, url)
+        except ProductPageMissing:
+            url = None
+    if not url:
+        urls = await asyncio.to_thread(search_product_urls, name)
+        if not urls:
+            raise HTTPException(status_code=500, detail="Ozon: item not found")
+        url = urls[0]
+        info, digest, cached_price = await asyncio.to_thread(parse_ozon_product, url)
+        await database.execute(products.update().where(products.c.id == product_id).values(url=url))
 
-    # Парсим первый результат
-    info = parse_ozon_product(urls[0])
     if not info or len(info) < 7:
         raise HTTPException(status_code=500, detail="Ozon: parsing failed")
 
-    sku, _, _, price_str, _, _, _ = info
+    today = datetime.now().date()
 
-    # Получаем ID конкурента Ozon
-    comp = await database.fetch_one(competitors.select().where(competitors.c.name == "Ozon"))
-    if not comp:
-        raise HTTPException(status_code=500, detail="Competitor 'Ozon' missing")
+    # Карточка не изменилась, и её цена всё ещё последняя в БД — цену не
+    # разбираем, только продлеваем интервал (в режиме "append" пишем каждую выборку)
+    if cached_price is not None and PRICE_STORAGE_MODE == "changes":
+        last = await get_latest_price_record(product_id, comp["id"])
+        if last and last["price"] == cached_price and continues_interval(last, today):
+            return await extend_price_record(last, today), False
+
+    sku, _, _, price_str, _, _, _ = info
 
     # Парсим цену
     try:
@@ -142,18 +432,19 @@ async def create_price_record_from_ozon(product_id: int) -> PriceRecord:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ozon: invalid price format → {e}")
 
-    # Создаем запись о цене
-    rec_in = PriceRecordCreate(
-        product_id=product_id,
-        competitor_id=comp["id"],
-        price=price,
-        date=datetime.now().date()
-    )
+    # Создаем запись о цене (или продлеваем интервал неизменной цены)
+    result = await store_price(product_id, comp["id"], price, today)
+    # хэш карточки запоминаем только после того, как её цена попала в БД
+    await asyncio.to_thread(get_scrape_cache().put, url, digest, price)
+    return result
 
-    query = price_records.insert().values(**rec_in.model_dump())
-    record_id = await database.execute(query)
 
-    return PriceRecord(id=record_id, **rec_in.model_dump())
+async def create_price_record_from_ozon(product_id: int) -> PriceRecord:
+    """Парсинг по запросу из API (воркер публикует события сам, см. worker.py)."""
+    record, created = await scrape_ozon_price(product_id)
+    if created:
+        await notify_price_stored(record)
+    return record
 
 
 async def fetch_all_ozon_prices() -> list[PriceRecord]:
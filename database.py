@@ -1,8 +1,29 @@
 from databases import Database
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, inspect, text
 
 DATABASE_URL = "sqlite:///./db.sqlite3"
 
 database = Database(DATABASE_URL)
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-metadata = MetaData()
\ No newline at end of file
+metadata = MetaData()
+
+
+def upgrade_schema(metadata: MetaData) -> None:
+    """Создаёт таблицы и докидывает в существующие недостающие колонки и индексы.
+
+    create_all не трогает уже созданные таблицы, поэтому новые nullable-колонки
+    добавляем через ALTER TABLE.
+    """
+    metadata.create_all(engine)
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+            indexes = {i["name"] for i in insp.get_indexes(table.name)}
+            for idx in table.indexes:
+                if idx.name not in indexes:
+                    idx.create(conn)
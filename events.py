@@ -0,0 +1,40 @@
+# events.py
+# События об изменении цен: воркер публикует их в Redis pub/sub,
+# веб-процессы подписываются и рассылают изменённые строки дашборда по SSE.
+# Цены, записанные самим API (POST /prices, кнопка «Обновить»), проходят через
+# notify_price_stored: main.py регистрирует обработчик, который сбрасывает
+# кэш дашборда и публикует событие — crud и роутеры main.py не импортируют.
+
+import json
+
+from schemas import PriceRecord
+
+PRICE_EVENTS_CHANNEL = "price_events"
+
+_price_stored_handlers = []
+
+
+async def publish_price_event(r, record: PriceRecord) -> None:
+    payload = {
+        "product_id": record.product_id,
+        "competitor_id": record.competitor_id,
+        "price": record.price,
+        "date": record.date.isoformat(),
+    }
+    await r.publish(PRICE_EVENTS_CHANNEL, json.dumps(payload))
+
+
+def on_price_stored(handler):
+    """Регистрирует async-обработчик handler(record) новой цены в этом процессе."""
+    _price_stored_handlers.append(handler)
+    return handler
+
+
+async def notify_price_stored(record: PriceRecord) -> None:
+    for handler in _price_stored_handlers:
+        await handler(record)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Сообщение в формате text/event-stream (data — одной строкой JSON)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,71 +1,50 @@
 # price_spy-main/main.py
 
 import os
-from datetime import datetime, timedelta
 from typing import Optional, Dict
 
 from fastapi import (
     FastAPI, Depends, HTTPException, status,
-    Request, Form
+    Request, Form, UploadFile, File
 )
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import select, func
 from contextlib import asynccontextmanager 
+import asyncio
+import json
+import time
 
 from database import database
 from models import products, users, competitors
-import uvicorn
+from crud import get_latest_prices, bulk_create_products, parse_product_names
+from schemas import ProductBulkCreate, ProductBulkResult
+from events import PRICE_EVENTS_CHANNEL, format_sse, on_price_stored, publish_price_event
+from coordination import enqueue_tasks, cluster_status
 
 # ----------------------------
-# 1. Инициализация приложения
-# ----------------------------
-app = FastAPI()
-
-# ----------------------------
-# 2. Шаблоны
+# 1. Шаблоны
 # ----------------------------
 templates = Jinja2Templates(directory="templates")
 
-# main.py
-from models import metadata
-from database import engine  # ← импортируем engine и metadata из models.py
-
-metadata.create_all(engine)  # ← создаём таблицы
+# Схема БД создаётся/обновляется отдельно: `python migrate.py`.
+# Для локального запуска можно оставить AUTO_MIGRATE=1 — тогда миграция
+# выполнится в lifespan (при старте сервера, а не при импорте модуля).
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
 
 # ----------------------------
-# 2. JWT и безопасность
+# 2. JWT и безопасность (см. auth.py)
 # ----------------------------
-SECRET_KEY = os.getenv("SECRET_KEY", "change-me")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
-pwd_context    = CryptContext(schemes=["bcrypt"], deprecated="auto")
-templates      = Jinja2Templates(directory="templates")
+from auth import (
+    Token, User, pwd_context, authenticate_user, create_access_token,
+    get_user, get_current_user, require_user, require_admin,
+)
 
 # ----------------------------
 # 3. Pydantic-схемы
 # ----------------------------
-class Token(BaseModel):
-    access_token: str
-    token_type:   str
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
-    role:     Optional[str] = None
-
-class User(BaseModel):
-    username: str
-    role:     str
-
-class UserInDB(User):
-    hashed_password: str
-
 class ProductCreate(BaseModel):
     name: str
 
@@ -80,6 +59,9 @@ class Product(ProductCreate):
 # ----------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if AUTO_MIGRATE:
+        from migrate import migrate
+        await asyncio.to_thread(migrate)
     await database.connect()
 
     # Создаем дефолтных пользователей
@@ -102,59 +84,16 @@ async def lifespan(app: FastAPI):
         await database.execute(competitors.insert().values(name="Ozon"))
 
     yield
+    if _sse_listener is not None:
+        _sse_listener.cancel()
     await database.disconnect()
-
-
-@app.on_event("shutdown")
-async def shutdown():
-    await database.disconnect()
+    if _redis_client is not None:
+        await _redis_client.close()
 
 # ----------------------------
-# 5. Утилиты аутентификации
+# Инициализация приложения
 # ----------------------------
-async def get_user(username: str) -> Optional[UserInDB]:
-    row = await database.fetch_one(
-        select(users).where(users.c.username == username)
-    )
-    return UserInDB(**row) if row else None
-
-async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
-    user = await get_user(username)
-    if not user or not pwd_context.verify(password, user.hashed_password):
-        return None
-    return user
-
-def create_access_token(data: Dict[str,str], expires_delta: Optional[timedelta]=None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    exc = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Not authenticated",
-        headers={"WWW-Authenticate":"Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        role:     str = payload.get("role")
-        if username is None or role is None:
-            raise exc
-    except JWTError:
-        raise exc
-    user = await get_user(username)
-    if not user:
-        raise exc
-    return User(username=user.username, role=user.role)
-
-async def require_user(user: User = Depends(get_current_user)): return user
-
-async def require_admin(user: User = Depends(get_current_user)):
-    if user.role != "admin":
-        raise HTTPException(status_code=403, detail="Forbidden")
-    return user
+app = FastAPI(lifespan=lifespan)
 
 # ----------------------------
 # 6. API (JSON) маршруты
@@ -190,16 +129,100 @@ async def api_create_product(
     if exists:
         raise HTTPException(status_code=400, detail="Product name already exists")
     new_id = await database.execute(products.insert().values(**prod.model_dump()))
+    invalidate_fragments()
     row    = await database.fetch_one(select(products).where(products.c.id == new_id))
     return Product(**row)
 
+@app.post("/products/bulk", response_model=ProductBulkResult)
+async def api_bulk_create_products(
+    payload: ProductBulkCreate,
+    u: User = Depends(require_user)
+):
+    result = await bulk_create_products(payload.names)
+    invalidate_fragments()
+    if payload.fetch_prices:
+        result.enqueued = await enqueue_price_tasks([p.id for p in result.created])
+    return result
+
 @app.delete("/products/{pid}")
 async def api_delete_product(pid: int, u: User = Depends(require_admin)):
     await database.execute(products.delete().where(products.c.id == pid))
+    invalidate_fragments()
     return {"status":"deleted"}
 
 # ----------------------------
-# 7. Web (HTML) маршруты
+# 7. Дашборд: фрагменты таблицы цен
+# ----------------------------
+DASHBOARD_PAGE_SIZE = 50
+FRAGMENT_TTL        = 30   # сек; кэш сбрасывается раньше, если пришло событие о цене
+
+# (page,) → (время рендера, html); общий для всех пользователей
+_fragment_cache: Dict[tuple, tuple] = {}
+
+async def get_competitor_rows():
+    return await database.fetch_all(select(competitors).order_by(competitors.c.id))
+
+async def render_price_rows(page: int) -> str:
+    """HTML строк таблицы для страницы дашборда (кэшируется на FRAGMENT_TTL)."""
+    key = (page,)
+    cached = _fragment_cache.get(key)
+    if cached and time.monotonic() - cached[0] < FRAGMENT_TTL:
+        return cached[1]
+
+    rows = await database.fetch_all(
+        select(products).order_by(products.c.id)
+        .offset((page - 1) * DASHBOARD_PAGE_SIZE).limit(DASHBOARD_PAGE_SIZE)
+    )
+    html = templates.get_template("_price_rows.html").render(
+        products=rows,
+        competitors=await get_competitor_rows(),
+        prices=await get_latest_prices([r["id"] for r in rows]),
+    )
+    _fragment_cache[key] = (time.monotonic(), html)
+    return html
+
+async def render_price_row(product_id: int) -> Optional[str]:
+    row = await database.fetch_one(select(products).where(products.c.id == product_id))
+    if not row:
+        return None
+    return templates.get_template("_price_row.html").render(
+        p=row,
+        competitors=await get_competitor_rows(),
+        prices=await get_latest_prices([product_id]),
+    )
+
+def invalidate_fragments():
+    _fragment_cache.clear()
+
+async def render_dashboard(request: Request, user: User, page: int = 1, error: str = ""):
+    total = await database.fetch_val(select(func.count()).select_from(products))
+    pages = max(1, -(-total // DASHBOARD_PAGE_SIZE))
+    page  = min(max(page, 1), pages)
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "user": user,
+            "error": error,
+            "competitors": await get_competitor_rows(),
+            "rows_html": await render_price_rows(page),
+            "page": page,
+            "pages": pages,
+        }
+    )
+
+async def get_cookie_user(request: Request) -> Optional[User]:
+    cookie = request.cookies.get("Authorization", "")
+    if not cookie.startswith("Bearer "):
+        return None
+    token = cookie.removeprefix("Bearer ").strip()
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
+
+# ----------------------------
+# 8. Web (HTML) маршруты
 # ----------------------------
 @app.get("/", include_in_schema=False)
 async def web_root():
@@ -252,19 +275,17 @@ async def web_login(
     return resp
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def web_dashboard(request: Request):
-    cookie = request.cookies.get("Authorization", "")
-    if not cookie.startswith("Bearer "):
-        return RedirectResponse("/login")
-    token = cookie.removeprefix("Bearer ").strip()
-    try:
-        user = await get_current_user(token)
-    except HTTPException:
+async def web_dashboard(request: Request, page: int = 1):
+    user = await get_cookie_user(request)
+    if not user:
         return RedirectResponse("/login")
-    rows = await database.fetch_all(select(products))
-    return templates.TemplateResponse(
-        "index.html", {"request": request, "products": rows, "user": user}
-    )
+    return await render_dashboard(request, user, page)
+
+@app.get("/dashboard/rows", response_class=HTMLResponse)
+async def web_dashboard_rows(request: Request, page: int = 1):
+    if not await get_cookie_user(request):
+        return HTMLResponse(status_code=401)
+    return HTMLResponse(await render_price_rows(max(page, 1)))
 
 @app.get("/new", response_class=HTMLResponse)
 async def web_new_form(request: Request, error: str = ""):
@@ -307,8 +328,44 @@ async def web_new(request: Request, name: str = Form(...)):
         )
 
     new_id = await database.execute(products.insert().values(name=name))
+    invalidate_fragments()
     return RedirectResponse(f"/confirm/{new_id}", status_code=303)
 
+@app.get("/new/bulk", response_class=HTMLResponse)
+async def web_bulk_form(request: Request):
+    user = await get_cookie_user(request)
+    if not user:
+        return RedirectResponse("/login")
+    return templates.TemplateResponse(
+        "bulk_import.html", {"request": request, "user": user}
+    )
+
+@app.post("/new/bulk", response_class=HTMLResponse)
+async def web_bulk_import(
+    request: Request,
+    file: UploadFile = File(...),
+    fetch_prices: bool = Form(False)
+):
+    user = await get_cookie_user(request)
+    if not user:
+        return RedirectResponse("/login", status_code=302)
+
+    try:
+        names = parse_product_names(file.filename or "", await file.read())
+    except ValueError as e:
+        return templates.TemplateResponse(
+            "bulk_import.html",
+            {"request": request, "user": user, "error": f"Не удалось прочитать файл: {e}"}
+        )
+
+    result = await bulk_create_products(names)
+    invalidate_fragments()
+    if fetch_prices:
+        result.enqueued = await enqueue_price_tasks([p.id for p in result.created])
+    return templates.TemplateResponse(
+        "bulk_import.html", {"request": request, "user": user, "result": result}
+    )
+
 @app.get("/confirm/{pid}", response_class=HTMLResponse)
 async def web_confirm(request: Request, pid: int):
     cookie = request.cookies.get("Authorization", "")
@@ -343,19 +400,13 @@ async def web_delete(request: Request, pid: int):
 
     # 2) Если не админ — рендерим дашборд со встроенной ошибкой
     if user.role != "admin":
-        rows = await database.fetch_all(select(products))
-        return templates.TemplateResponse(
-            "index.html",
-            {
-                "request": request,
-                "products": rows,
-                "user": user,
-                "error": "У вас недостаточно прав для удаления товара"
-            }
+        return await render_dashboard(
+            request, user, error="У вас недостаточно прав для удаления товара"
         )
 
     # 3) Если админ — удаляем и редиректим
     await database.execute(products.delete().where(products.c.id == pid))
+    invalidate_fragments()
     return RedirectResponse("/dashboard", status_code=302)
 
 @app.get("/logout", response_class=RedirectResponse)
@@ -369,25 +420,153 @@ async def web_logout():
 # 10. Маршрут для запуска парсера
 # ----------------------------
 
-import redis.asyncio as redis
 from fastapi import BackgroundTasks
 
-REDIS_URL = "redis://localhost:6379"
-redis_client = redis.Redis.from_url(REDIS_URL)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+_redis_client = None
+
+def get_redis():
+    """Клиент Redis создаётся при первом обращении, а не при импорте."""
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as redis
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+async def enqueue_price_tasks(product_ids: list[int]) -> int:
+    """Ставит товары в очередь воркера пачками RPUSH."""
+    return await enqueue_tasks(get_redis(), product_ids)
 
 @app.post("/parse/trigger")
 async def trigger_ozon_parser(background_tasks: BackgroundTasks, u: User = Depends(require_admin)):
-    rows = await database.fetch_all(select(products))
-    for r in rows:
-        await redis_client.rpush("price_tasks", str(r["id"]))  # добавляем в очередь
+    rows = await database.fetch_all(select(products.c.id))
+    await enqueue_price_tasks([r["id"] for r in rows])  # добавляем в очередь
     return {"status": "Задачи добавлены в очередь Redis"}
 
 
+@app.get("/admin/workers")
+async def admin_workers(u: User = Depends(require_admin)):
+    """Живые воркеры, их задачи, пропускная способность и ETA очереди."""
+    return await cluster_status(get_redis())
+
+@app.get("/admin/workers/desired")
+async def admin_desired_workers(u: User = Depends(require_admin)):
+    """Сигнал для внешнего автоскейлера."""
+    cluster = await cluster_status(get_redis())
+    return {k: cluster[k] for k in ("desired_workers", "alive", "backlog", "backlog_eta_sec")}
+
+@app.post("/admin/prices/compact")
+async def compact_prices(u: User = Depends(require_admin)):
+    from compaction import run_compaction
+    return await run_compaction()
+
+
+@app.post("/admin/prices/rollup")
+async def rollup_prices(u: User = Depends(require_admin)):
+    from retention import run_retention
+    return await run_retention()
+
+
+# ----------------------------
+# 11. Live-обновления дашборда (SSE)
+# ----------------------------
+SSE_KEEPALIVE  = 15    # сек; комментарий-пинг, чтобы прокси не рвали соединение
+SSE_QUEUE_SIZE = 100   # событий в очереди одного клиента; медленный клиент пропускает лишние
+SSE_RETRY      = 5     # сек; пауза перед переподпиской после ошибки Redis
+
+# Один подписчик Redis на процесс: строка рендерится один раз на событие
+# и раздаётся во все открытые SSE-соединения через их очереди.
+_sse_clients: set[asyncio.Queue] = set()
+_sse_listener: Optional[asyncio.Task] = None
+
+async def invalidate_product_page(product_id: int):
+    """Сбрасывает кэш только той страницы дашборда, на которой товар."""
+    position = await database.fetch_val(
+        select(func.count()).select_from(products).where(products.c.id <= product_id)
+    )
+    _fragment_cache.pop((max(position - 1, 0) // DASHBOARD_PAGE_SIZE + 1,), None)
+
+@on_price_stored
+async def price_stored_here(record):
+    """Цена записана этим процессом: свой кэш сбрасываем сразу, остальным
+    процессам (и своим SSE-клиентам через подписчика) — событие в Redis."""
+    await invalidate_product_page(record.product_id)
+    try:
+        await publish_price_event(get_redis(), record)
+    except Exception as e:
+        print(f"⚠ Не удалось опубликовать событие цены: {e}")
+
+async def broadcast_price_event(event: dict):
+    await invalidate_product_page(event["product_id"])
+    html = await render_price_row(event["product_id"])
+    if not html:
+        return
+    message = format_sse("price", {"product_id": event["product_id"], "html": html})
+    for queue in list(_sse_clients):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+async def listen_price_events():
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(PRICE_EVENTS_CHANNEL)
+            async for msg in pubsub.listen():
+                if msg["type"] == "message":
+                    await broadcast_price_event(json.loads(msg["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠ Подписка на события цен прервалась: {e}")
+            await asyncio.sleep(SSE_RETRY)
+        finally:
+            await pubsub.close()
+
+def ensure_price_listener():
+    """Подписчик запускается при первом SSE-клиенте, а не при старте API."""
+    global _sse_listener
+    if _sse_listener is None or _sse_listener.done():
+        _sse_listener = asyncio.create_task(listen_price_events())
+
+@app.get("/dashboard/events")
+async def web_dashboard_events(request: Request):
+    if not await get_cookie_user(request):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    _sse_clients.add(queue)
+    ensure_price_listener()
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        except asyncio.CancelledError:
+            pass
+        finally:
+            _sse_clients.discard(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 from routes.ozon_routes import router as ozon_router
+from routes.price_routes import router as price_router
+from routes.analytics_routes import router as analytics_router
 app.include_router(ozon_router)
+app.include_router(price_router)
+app.include_router(analytics_router)
 
 # ----------------------------
-# 8. Запуск приложения
+# 12. Запуск приложения
 # ----------------------------
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,17 @@
+# migrate.py
+# Создание и обновление схемы БД отдельно от импорта приложения:
+#   python migrate.py
+# В проде запускается один раз перед стартом подов API (AUTO_MIGRATE=0),
+# локально main.py сам вызывает migrate() при старте, если AUTO_MIGRATE=1.
+
+from database import upgrade_schema
+from models import metadata
+
+
+def migrate() -> None:
+    upgrade_schema(metadata)  # create_all + недостающие колонки/индексы
+
+
+if __name__ == "__main__":
+    migrate()
+    print("Схема БД обновлена")
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, Float, Date, ForeignKey, MetaData
+from sqlalchemy import Table, Column, Integer, String, Float, Date, ForeignKey, MetaData, Index, UniqueConstraint
 
 metadata = MetaData()
 
@@ -7,6 +7,7 @@ products = Table(
     Column("id", Integer, primary_key=True),
     Column("name", String, nullable=False, unique=True),
     Column("sku", String, nullable=True, unique=True),
+    Column("url", String, nullable=True),   # карточка на Ozon, найденная при первом парсинге
 )
 
 users = Table(
@@ -29,5 +30,54 @@ price_records = Table(
     Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
     Column("competitor_id", Integer, ForeignKey("competitors.id"), nullable=False),
     Column("price", Float, nullable=False),
-    Column("date", Date, nullable=False),
-)
\ No newline at end of file
+    Column("date", Date, nullable=False),               # начало интервала (valid_from)
+    Column("valid_to", Date, nullable=True),            # последний день с этой ценой; NULL — только date
+    Index("ix_price_records_competitor_date", "competitor_id", "date"),
+    Index("ix_price_records_product_competitor_date", "product_id", "competitor_id", "date"),
+)
+
+# Рассчитанные метрики цен (заполняются analytics.compute_price_metrics)
+price_metrics = Table(
+    "price_metrics", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("competitor_id", Integer, ForeignKey("competitors.id"), nullable=False),
+    Column("date", Date, nullable=False, index=True),
+    Column("price", Float, nullable=False),
+    Column("change_pct", Float, nullable=True),
+    Column("rolling_avg", Float, nullable=True),
+    Column("percentile_rank", Float, nullable=True),
+    Column("price_index", Float, nullable=True),
+)
+
+alert_rules = Table(
+    "alert_rules", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False, unique=True),
+    Column("competitor_id", Integer, ForeignKey("competitors.id"), nullable=True),
+    Column("threshold_pct", Float, nullable=False),
+    Column("direction", String(10), nullable=False, default="any"),
+)
+
+
+# Агрегаты истории цен (заполняются retention.run_retention):
+# сырые записи старше RAW_RETENTION_DAYS сворачиваются по дням,
+# дневные агрегаты старше DAILY_RETENTION_DAYS — по неделям.
+def _price_rollup_table(name: str) -> Table:
+    return Table(
+        name, metadata,
+        Column("id", Integer, primary_key=True),
+        Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+        Column("competitor_id", Integer, ForeignKey("competitors.id"), nullable=False),
+        Column("period_start", Date, nullable=False),
+        Column("price_min", Float, nullable=False),
+        Column("price_max", Float, nullable=False),
+        Column("price_avg", Float, nullable=False),
+        Column("price_last", Float, nullable=False),
+        Column("samples", Integer, nullable=False),
+        UniqueConstraint("product_id", "competitor_id", "period_start", name=f"uq_{name}_period"),
+        Index(f"ix_{name}_competitor_period", "competitor_id", "period_start"),
+    )
+
+price_rollups_daily  = _price_rollup_table("price_rollups_daily")
+price_rollups_weekly = _price_rollup_table("price_rollups_weekly")
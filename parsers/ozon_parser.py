@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import time
 import random
 import csv
@@ -11,21 +12,98 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 
 # ========== НАСТРОЙКИ ==========
 SEARCH_FILE    = "names.txt"   # вход: по одному названию товара в строке
 OUTPUT_CSV     = "products.csv"
 MAX_PER_NAME   = 3             # сколько первых результатов парсить для каждого запроса
 PROXY          = None          # или "ip:port"
+
+# «Лёгкий» режим браузера: нам нужны только ld+json и ссылки /product/,
+# поэтому картинки, шрифты, медиа и трекеры не грузим
+LEAN_MODE      = os.getenv("OZON_LEAN", "1") == "1"
+HEADLESS       = os.getenv("OZON_HEADLESS", "0") == "1"
+PROFILE_DIR    = os.getenv("OZON_PROFILE_DIR")   # постоянный профиль (cookies, localStorage) — свой на каждый воркер
+CACHE_DIR      = os.getenv("OZON_CACHE_DIR")     # общий дисковый кэш Chrome
+
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.m3u8",
+    "*ir.ozone.ru/*",                             # CDN картинок товаров
+]
+TRACKER_DOMAINS = [
+    "mc.yandex.ru", "an.yandex.ru", "yandex.ru/ads",
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "top-fwz1.mail.ru", "vk.com/rtrg", "facebook.net",
+    "criteo.com", "criteo.net", "adriver.ru", "mytarget.ru",
+]
+
+WAIT_TIMEOUT   = 15            # сек; явные ожидания заканчиваются, как только условие выполнено
+POLL_INTERVAL  = 0.25
+LINKS_SETTLE   = 1.0           # сек; выдача кончилась, если внизу страницы ссылок столько же
+
+# Анти-бот: паузы «как у человека», отдельно от ожиданий загрузки.
+# Профиль выбирается OZON_PACING; значения — диапазоны (min, max) секунд.
+PACING_PROFILES = {
+    "human": {
+        "after_home":    (1.0, 2.0),
+        "typing":        (0.1, 0.25),   # между символами
+        "before_submit": (0.3, 1.2),
+        "on_page":       (0.3, 1.2),    # «читаем» страницу товара
+        "between_pages": (0.5, 1.2),
+    },
+    "fast": {
+        "after_home":    (0.2, 0.5),
+        "typing":        (0.02, 0.06),
+        "before_submit": (0.1, 0.3),
+        "on_page":       (0.0, 0.2),
+        "between_pages": (0.1, 0.3),
+    },
+    "off": {
+        "after_home":    (0, 0),
+        "typing":        (0, 0),
+        "before_submit": (0, 0),
+        "on_page":       (0, 0),
+        "between_pages": (0, 0),
+    },
+}
+PACING_NAME = os.getenv("OZON_PACING", "human")
+if PACING_NAME not in PACING_PROFILES:
+    print(f"⚠ Неизвестный OZON_PACING={PACING_NAME!r}, используем human")
+    PACING_NAME = "human"
+PACING = PACING_PROFILES[PACING_NAME]
 # ================================
 
 def human_delay(a=0.3, b=1.2):
     time.sleep(random.uniform(a, b))
 
-def init_driver():
+def pause(kind):
+    """Анти-бот пауза из текущего профиля PACING."""
+    a, b = PACING[kind]
+    if b > 0:
+        human_delay(a, b)
+
+def block_heavy_resources(driver):
+    """Через CDP запрещаем загрузку тяжёлых ресурсов и трекеров."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {
+        "urls": BLOCKED_URL_PATTERNS + [f"*{d}*" for d in TRACKER_DOMAINS]
+    })
+
+def init_driver(lean=LEAN_MODE, headless=HEADLESS):
     options = uc.ChromeOptions()
-    # НЕ включаем headless
-    # options.headless = True
+    # headless только по настройке OZON_HEADLESS=1: без него Ozon реже показывает капчу
+    if lean:
+        # ждём DOMContentLoaded, а не догрузку всех ресурсов
+        options.page_load_strategy = "eager"
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--mute-audio")
+        options.add_argument("--no-first-run")
+    if CACHE_DIR:
+        options.add_argument(f"--disk-cache-dir={CACHE_DIR}")
 
     # прячем WebDriver fingerprint
     options.add_argument("--disable-blink-features=AutomationControlled")
@@ -41,19 +119,87 @@ def init_driver():
     if PROXY:
         options.add_argument(f"--proxy-server={PROXY}")
 
-    driver = uc.Chrome(options=options)
+    driver = uc.Chrome(options=options, headless=headless, user_data_dir=PROFILE_DIR)
     driver.set_page_load_timeout(30)
+    driver.set_script_timeout(5)
+    if lean:
+        block_heavy_resources(driver)
     return driver
 
 def human_typing(el, text):
+    if PACING["typing"][1] <= 0:
+        el.send_keys(text)
+        return
     for ch in text:
         el.send_keys(ch)
-        time.sleep(random.uniform(0.1, 0.25))
+        pause("typing")
+
+# Ссылки /product/ без query-строки, без повторов — одним вызовом JS
+PRODUCT_LINKS_JS = """
+const limit = arguments[0], links = [];
+for (const a of document.querySelectorAll("a[href*='/product/']")) {
+    const href = a.href.split("?")[0];
+    if (href.includes("/product/") && !links.includes(href)) {
+        links.push(href);
+        if (links.length >= limit) break;
+    }
+}
+return links;
+"""
+
+# Скролл на 3/4 экрана; true — дошли до конца страницы
+SCROLL_JS = """
+window.scrollBy(0, window.innerHeight * 0.75);
+return window.innerHeight + window.scrollY >= document.documentElement.scrollHeight - 2;
+"""
+
+def product_links_loaded(limit, settle=LINKS_SETTLE):
+    """Условие ожидания: на странице есть limit ссылок /product/ — или выдача
+    короче: страница докручена до конца, и ссылок не прибавилось за settle сек.
+
+    Пока ссылок мало — подскролливаем, чтобы подгрузились карточки.
+    """
+    state = {"count": None, "since": 0.0}
+    def check(driver):
+        count = len(driver.execute_script(PRODUCT_LINKS_JS, limit))
+        if count >= limit:
+            return True
+        at_bottom = driver.execute_script(SCROLL_JS)
+        now = time.monotonic()
+        if not at_bottom or count != state["count"]:
+            state["count"], state["since"] = count, now
+            return False
+        return now - state["since"] >= settle
+    return check
+
+LD_JSON_JS = """
+return Array.from(document.querySelectorAll("script[type='application/ld+json']"))
+    .map(s => s.textContent);
+"""
+
+def find_product_ld(driver):
+    """Условие ожидания: среди ld+json есть объект @type=Product — его и возвращаем."""
+    for text in driver.execute_script(LD_JSON_JS):
+        try:
+            data = json.loads(text.strip())
+        except json.JSONDecodeError:
+            continue
+
+        if isinstance(data, list):
+            prod = next((x for x in data if isinstance(x, dict) and x.get("@type") == "Product"), None)
+        elif isinstance(data, dict) and data.get("@type") == "Product":
+            prod = data
+        else:
+            prod = None
+
+        if prod:
+            return prod
+    return False
 
 def search_and_get_links(driver, query):
     # 1) на главную
     driver.get("https://www.ozon.ru/")
-    human_delay(1, 2)
+    pause("after_home")
 
     # 2) ждём поле поиска по атрибуту name="text"
     search_input = WebDriverWait(driver, 10).until(
@@ -61,65 +207,56 @@ def search_and_get_links(driver, query):
     )
     ActionChains(driver).move_to_element(search_input).click().perform()
     human_typing(search_input, query)
-    human_delay()
+    pause("before_submit")
+    home_url = driver.current_url
     search_input.submit()
 
-    # 3) даём странице загрузиться
-    human_delay(2, 4)
-
-    # 4) скроллим вниз по чуть-чуть, чтобы подгрузить карточки
-    for _ in range(4):
-        driver.execute_script("window.scrollBy(0, window.innerHeight * 0.75);")
-        human_delay(0.5, 1.5)
+    # 3) ждём перехода на выдачу (на главной тоже есть карточки товаров)
+    WebDriverWait(driver, WAIT_TIMEOUT).until(EC.url_changes(home_url))
 
-    # 5) собираем первые ссылки с /product/
-    elems = driver.find_elements(By.XPATH, "//a[contains(@href,'/product/')]")
-    links = []
-    for a in elems:
-        href = a.get_attribute("href")
-        if not href:
-            continue
-        clean = href.split("?")[0]
-        if "/product/" in clean and clean not in links:
-            links.append(clean)
-        if len(links) >= MAX_PER_NAME:
-            break
+    # 4) ждём, пока появятся первые MAX_PER_NAME ссылок /product/ или кончится
+    #    выдача, подскролливая
+    try:
+        WebDriverWait(driver, WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+            product_links_loaded(MAX_PER_NAME)
+        )
+    except TimeoutException:
+        pass  # берём сколько успело загрузиться
+    links = driver.execute_script(PRODUCT_LINKS_JS, MAX_PER_NAME)
 
     if not links:
         raise RuntimeError("При поиске не нашлось ни одной ссылки /product/")
     return links
 
+class ProductPageMissing(Exception):
+    """На странице нет ld+json Product: карточку удалили или URL устарел."""
+
 def parse_product(driver, url):
     driver.get(url)
-    WebDriverWait(driver, 10).until(
-        EC.presence_of_element_located((By.CSS_SELECTOR, "script[type='application/ld+json']"))
-    )
-    human_delay()
-
-    # ещё пару скроллов, на всякий случай
-    for _ in range(2):
-        driver.execute_script("window.scrollBy(0, window.innerHeight * 0.5);")
-        human_delay(0.3, 0.8)
-
-    scripts = driver.find_elements(By.CSS_SELECTOR, "script[type='application/ld+json']")
-    info = {}
-    for s in scripts:
-        try:
-            data = json.loads(s.get_attribute("innerHTML").strip())
-        except json.JSONDecodeError:
-            continue
-
-        if isinstance(data, list):
-            prod = next((x for x in data if x.get("@type") == "Product"), None)
-        elif data.get("@type") == "Product":
-            prod = data
-        else:
-            prod = None
-
-        if prod:
-            info = prod
-            break
-
+    # ждём ровно до появления ld+json с Product, без лишних скроллов
+    info = WebDriverWait(driver, WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(find_product_ld)
+    pause("on_page")
+    return product_fields(info)
+
+def parse_product_cached(driver, url, cache):
+    """Как parse_product, но сверяет ld+json с кэшем.
+
+    Возвращает (поля товара, хэш, cached_price); cached_price — цена, уже
+    записанная в БД для того же содержимого карточки (None, если товар
+    изменился). Кэш не обновляется: это делает вызывающий через
+    cache.put(url, хэш, цена) после записи цены.
+    """
+    driver.get(url)
+    try:
+        info = WebDriverWait(driver, WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(find_product_ld)
+    except TimeoutException:
+        raise ProductPageMissing(url)
+    digest, cached_price = cache.lookup(url, info)
+    pause("on_page")
+    return product_fields(info), digest, cached_price
+
+def product_fields(info):
+    """Поля товара из ld+json Product."""
     sku     = info.get("sku")
     name    = info.get("name")
     desc    = info.get("description")
@@ -171,7 +308,7 @@ def main():
                     print(f"  → спарсил {url}")
                 except Exception as e:
                     print(f"  ✗ не удалось спарсить {url}: {e}")
-                human_delay(0.5, 1.2)
+                pause("between_pages")
 
     driver.quit()
     print("Готово, результаты в", OUTPUT_CSV)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Кэш результатов парсинга карточек Ozon.
+# Для каждого URL храним хэш последнего ld+json Product и цену, которая по нему
+# записана в БД. Если при повторном парсинге хэш тот же, а последняя цена в БД
+# совпадает с сохранённой, цену заново не разбираем — только продлеваем
+# интервал. Хэш сохраняется лишь после успешной записи цены (put), поэтому
+# сбой между парсингом и БД не «замораживает» старую цену.
+# Экономится только разбор и запись в БД: страница всё равно загружается.
+# Условных HEAD-запросов (ETag/Last-Modified) не делаем: это лишние запросы
+# к сайту с анти-бот защитой, а ответов 304 от карточек Ozon мы не видели.
+# Хранится в SQLite на диске, размер ограничен MAX_ENTRIES (вытесняем LRU).
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# ========== НАСТРОЙКИ ==========
+CACHE_PATH  = os.getenv("OZON_SCRAPE_CACHE", "scrape_cache.sqlite3")
+MAX_ENTRIES = int(os.getenv("OZON_SCRAPE_CACHE_SIZE", "50000"))
+# ================================
+
+# Исходы обращения к кэшу, по ним считается статистика
+UNCHANGED = "unchanged"      # ld+json тот же, что в прошлый раз
+CHANGED   = "changed"        # новый URL или изменившийся товар
+OUTCOMES  = (UNCHANGED, CHANGED)
+
+
+def content_hash(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ScrapeCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            # старая схема хранила весь ld+json, который никто не читал
+            conn.execute("DROP TABLE IF EXISTS entries")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url           TEXT PRIMARY KEY,
+                    content_hash  TEXT NOT NULL,
+                    price         REAL NOT NULL,
+                    accessed_at   REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_pages_accessed ON pages (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        # кэшем пользуются несколько воркеров, поэтому ждём блокировку, а не падаем
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, url, payload):
+        """Возвращает (хэш ld+json, цена из БД для того же содержимого или None)."""
+        digest = content_hash(payload)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT price FROM pages WHERE url = ? AND content_hash = ?", (url, digest)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._record(conn, UNCHANGED if row else CHANGED)
+        return digest, (row[0] if row else None)
+
+    def put(self, url, digest, price):
+        """Запоминает содержимое карточки после того, как его цена записана в БД."""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO pages (url, content_hash, price, accessed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    content_hash = excluded.content_hash, price = excluded.price,
+                    accessed_at = excluded.accessed_at
+                """,
+                (url, digest, price, time.time()),
+            )
+            self._evict(conn)
+
+    def stats(self):
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        result = {name: counters.get(name, 0) for name in OUTCOMES}
+        total = sum(result.values())
+        result.update({
+            "lookups": total,
+            "hit_rate": round(result[UNCHANGED] / total, 4) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        })
+        return result
+
+    @staticmethod
+    def _record(conn, outcome):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (outcome,),
+        )
+
+    def _evict(self, conn):
+        excess = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM pages WHERE url IN "
+                "(SELECT url FROM pages ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+
+
+_cache = None
+
+def get_scrape_cache():
+    global _cache
+    if _cache is None:
+        _cache = ScrapeCache()
+    return _cache
@@ -0,0 +1,26 @@
+# price_history.py
+# Общие помощники для истории цен, которыми пользуются compaction.py,
+# retention.py и analytics.py.
+
+import numpy as np
+
+DELETE_BATCH = 900   # лимит параметров SQLite в IN (...)
+
+
+def expand_intervals(firsts: np.ndarray, lasts: np.ndarray):
+    """Разворачивает интервалы [first, last] по дням.
+
+    firsts/lasts — datetime64[D] или целые номера дней. Возвращает
+    (номер исходного интервала, день) для каждого дня каждого интервала.
+    """
+    steps   = lasts - firsts
+    lengths = steps.astype(np.int64) + 1
+    rec     = np.repeat(np.arange(len(firsts)), lengths)
+    offsets = np.arange(len(rec)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return rec, firsts[rec] + offsets.astype(steps.dtype)
+
+
+def delete_ids(conn, table, ids) -> None:
+    """Удаляет строки по id пачками по DELETE_BATCH."""
+    for i in range(0, len(ids), DELETE_BATCH):
+        conn.execute(table.delete().where(table.c.id.in_(ids[i:i + DELETE_BATCH])))
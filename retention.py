@@ -0,0 +1,262 @@
+# retention.py
+# Политика хранения истории цен:
+#   * сырые записи price_records — RAW_RETENTION_DAYS дней;
+#   * дневные агрегаты min/max/avg/last (price_rollups_daily) — DAILY_RETENTION_DAYS дней;
+#   * дальше — недельные агрегаты (price_rollups_weekly).
+# Фоновая задача run_retention() сворачивает старые данные в агрегаты и
+# удаляет исходные строки, так что «горячая» таблица остаётся маленькой.
+
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select, cast, func, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import engine
+from models import price_records, price_rollups_daily, price_rollups_weekly
+from price_history import expand_intervals, delete_ids
+
+# ========== НАСТРОЙКИ ==========
+RAW_RETENTION_DAYS   = int(os.getenv("RAW_RETENTION_DAYS", "90"))
+DAILY_RETENTION_DAYS = int(os.getenv("DAILY_RETENTION_DAYS", "730"))
+PRODUCT_CHUNK        = 5000    # сколько товаров сворачиваем за одну транзакцию
+INSERT_BATCH         = 5000
+# ================================
+
+
+def raw_cutoff(today: Optional[date] = None) -> date:
+    """Первый день, который ещё хранится в сыром виде."""
+    return (today or date.today()) - timedelta(days=RAW_RETENTION_DAYS)
+
+
+def daily_cutoff(today: Optional[date] = None) -> date:
+    """Первый день, который ещё хранится в дневных агрегатах (начало недели)."""
+    return week_start((today or date.today()) - timedelta(days=DAILY_RETENTION_DAYS))
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def choose_resolution(start: date, end: date, today: Optional[date] = None) -> str:
+    """Разрешение истории для диапазона: самое детальное, которое ещё хранится
+    для start и не раздувает ответ на длинных диапазонах."""
+    span = (end - start).days
+    if start >= raw_cutoff(today) and span <= RAW_RETENTION_DAYS:
+        return "raw"
+    if start >= daily_cutoff(today) and span <= DAILY_RETENTION_DAYS:
+        return "daily"
+    return "weekly"
+
+
+# ----------------------------
+# Векторная агрегация
+# ----------------------------
+
+def aggregate(product_ids, competitor_ids, periods, order, price_min, price_max, price_sum, samples, price_last) -> dict:
+    """Группирует точки по (товар, конкурент, период) и сворачивает их.
+
+    periods — datetime64[D] начала периода, order — порядок внутри периода
+    (для price_last берётся точка с максимальным order).
+    """
+    idx = np.lexsort((order, periods, competitor_ids, product_ids))
+    product_ids, competitor_ids, periods = product_ids[idx], competitor_ids[idx], periods[idx]
+    price_min, price_max, price_sum = price_min[idx], price_max[idx], price_sum[idx]
+    samples, price_last = samples[idx], price_last[idx]
+
+    new_group = np.ones(len(idx), dtype=bool)
+    new_group[1:] = (
+        (product_ids[1:] != product_ids[:-1])
+        | (competitor_ids[1:] != competitor_ids[:-1])
+        | (periods[1:] != periods[:-1])
+    )
+    starts = np.flatnonzero(new_group)
+    ends = np.append(starts[1:], len(idx)) - 1
+    total_samples = np.add.reduceat(samples, starts)
+
+    return {
+        "product_id":    product_ids[starts],
+        "competitor_id": competitor_ids[starts],
+        "period_start":  periods[starts],
+        "price_min":     np.minimum.reduceat(price_min, starts),
+        "price_max":     np.maximum.reduceat(price_max, starts),
+        "price_avg":     np.add.reduceat(price_sum, starts) / total_samples,
+        "price_last":    price_last[ends],
+        "samples":       total_samples,
+    }
+
+
+def aggregate_raw(rows, period: str = "daily") -> dict:
+    """Сворачивает строки (id, product_id, competitor_id, price, date, valid_to) по дням или неделям.
+
+    date и valid_to — строки/даты; интервалы заранее обрезаны вызывающим.
+    """
+    ids, pids, cids, prices, firsts, lasts = zip(*rows)
+    ids    = np.fromiter(ids, dtype=np.int64, count=len(rows))
+    pids   = np.fromiter(pids, dtype=np.int64, count=len(rows))
+    cids   = np.fromiter(cids, dtype=np.int64, count=len(rows))
+    prices = np.fromiter(prices, dtype=np.float64, count=len(rows))
+    rec, days = expand_intervals(
+        np.array(firsts, dtype="datetime64[D]"), np.array(lasts, dtype="datetime64[D]")
+    )
+    periods = to_week_start(days) if period == "weekly" else days
+    # последняя цена периода — по дню, а внутри дня — по id записи
+    order = days.astype(np.int64) * (int(ids.max()) + 1) + ids[rec]
+    p = prices[rec]
+    return aggregate(
+        pids[rec], cids[rec], periods, order,
+        p, p, p, np.ones(len(rec), dtype=np.int64), p,
+    )
+
+
+def aggregate_rollups(rows, period: str = "weekly") -> dict:
+    """Сворачивает агрегаты (product_id, competitor_id, period_start, min, max, avg, last, samples) по неделям или дням."""
+    pids, cids, periods, mins, maxs, avgs, lasts, samples = zip(*rows)
+    periods = np.array(periods, dtype="datetime64[D]")
+    samples = np.fromiter(samples, dtype=np.int64, count=len(rows))
+    return aggregate(
+        np.fromiter(pids, dtype=np.int64, count=len(rows)),
+        np.fromiter(cids, dtype=np.int64, count=len(rows)),
+        to_week_start(periods) if period == "weekly" else periods,
+        periods.astype(np.int64),
+        np.fromiter(mins, dtype=np.float64, count=len(rows)),
+        np.fromiter(maxs, dtype=np.float64, count=len(rows)),
+        np.fromiter(avgs, dtype=np.float64, count=len(rows)) * samples,
+        samples,
+        np.fromiter(lasts, dtype=np.float64, count=len(rows)),
+    )
+
+
+def to_week_start(days: np.ndarray) -> np.ndarray:
+    # 1970-01-01 — четверг, поэтому сдвигаем на 3 дня, чтобы неделя начиналась с понедельника
+    return ((days.astype(np.int64) + 3) // 7 * 7 - 3).astype("datetime64[D]")
+
+
+def as_rows(agg: dict) -> list[dict]:
+    columns = zip(
+        agg["product_id"].tolist(), agg["competitor_id"].tolist(),
+        agg["period_start"].astype(object).tolist(),
+        agg["price_min"].tolist(), agg["price_max"].tolist(),
+        agg["price_avg"].round(4).tolist(), agg["price_last"].tolist(), agg["samples"].tolist(),
+    )
+    return [
+        {
+            "product_id": pid, "competitor_id": cid, "period_start": start,
+            "price_min": lo, "price_max": hi, "price_avg": avg, "price_last": last, "samples": n,
+        }
+        for pid, cid, start, lo, hi, avg, last, n in columns
+    ]
+
+
+# ----------------------------
+# Запись агрегатов
+# ----------------------------
+
+def _upsert_rollups(conn, table, rows: list[dict]) -> None:
+    """Вставляет агрегаты; если период уже есть — объединяет с существующим."""
+    stmt = sqlite_insert(table)
+    ex, c = stmt.excluded, table.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["product_id", "competitor_id", "period_start"],
+        set_={
+            "price_min":  func.min(c.price_min, ex.price_min),
+            "price_max":  func.max(c.price_max, ex.price_max),
+            "price_avg":  (c.price_avg * c.samples + ex.price_avg * ex.samples) / (c.samples + ex.samples),
+            "price_last": ex.price_last,
+            "samples":    c.samples + ex.samples,
+        },
+    )
+    for i in range(0, len(rows), INSERT_BATCH):
+        conn.execute(stmt, rows[i:i + INSERT_BATCH])
+
+
+def _rollup_raw_chunk(conn, first_pid: int, last_pid: int, cutoff: date) -> int:
+    """Сворачивает дни до cutoff из price_records в дневные агрегаты."""
+    pr = price_records.c
+    valid_to = func.coalesce(pr.valid_to, pr.date)
+    rows = conn.execute(
+        select(pr.id, pr.product_id, pr.competitor_id, pr.price, cast(pr.date, String), cast(valid_to, String))
+        .where(pr.product_id.between(first_pid, last_pid))
+        .where(pr.date < cutoff)
+    ).fetchall()
+    if not rows:
+        return 0
+
+    last_old_day = (cutoff - timedelta(days=1)).isoformat()
+    clipped = [(i, p, c, price, first, min(last, last_old_day)) for i, p, c, price, first, last in rows]
+    _upsert_rollups(conn, price_rollups_daily, as_rows(aggregate_raw(clipped, "daily")))
+
+    # интервалы, заходящие за cutoff, не удаляем, а укорачиваем
+    conn.execute(
+        price_records.update()
+        .where(pr.product_id.between(first_pid, last_pid))
+        .where(pr.date < cutoff)
+        .where(valid_to >= cutoff)
+        .values(date=cutoff)
+    )
+    conn.execute(
+        price_records.delete()
+        .where(pr.product_id.between(first_pid, last_pid))
+        .where(pr.date < cutoff)
+    )
+    return len(rows)
+
+
+def _rollup_daily_chunk(conn, first_pid: int, last_pid: int, cutoff: date) -> int:
+    """Сворачивает дневные агрегаты до cutoff (начало недели) в недельные."""
+    d = price_rollups_daily.c
+    rows = conn.execute(
+        select(
+            d.id, d.product_id, d.competitor_id, cast(d.period_start, String),
+            d.price_min, d.price_max, d.price_avg, d.price_last, d.samples,
+        )
+        .where(d.product_id.between(first_pid, last_pid))
+        .where(d.period_start < cutoff)
+    ).fetchall()
+    if not rows:
+        return 0
+
+    _upsert_rollups(conn, price_rollups_weekly, as_rows(aggregate_rollups([r[1:] for r in rows])))
+    delete_ids(conn, price_rollups_daily, [r[0] for r in rows])
+    return len(rows)
+
+
+def _product_range(conn, table):
+    return conn.execute(select(func.min(table.c.product_id), func.max(table.c.product_id))).one()
+
+
+def apply_retention(today: Optional[date] = None) -> dict:
+    """Сворачивает устаревшие сырые записи и дневные агрегаты."""
+    started = time.perf_counter()
+    raw_to, daily_to = raw_cutoff(today), daily_cutoff(today)
+    result = {"raw_rolled_up": 0, "daily_rolled_up": 0}
+
+    for table, step, key, cutoff in (
+        (price_records, _rollup_raw_chunk, "raw_rolled_up", raw_to),
+        (price_rollups_daily, _rollup_daily_chunk, "daily_rolled_up", daily_to),
+    ):
+        with engine.connect() as conn:
+            lo, hi = _product_range(conn, table)
+        if lo is None:
+            continue
+        for first in range(lo, hi + 1, PRODUCT_CHUNK):
+            with engine.begin() as conn:
+                result[key] += step(conn, first, first + PRODUCT_CHUNK - 1, cutoff)
+
+    result["raw_cutoff"] = raw_to
+    result["daily_cutoff"] = daily_to
+    result["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_retention(today: Optional[date] = None) -> dict:
+    return await asyncio.to_thread(apply_retention, today)
+
+
+if __name__ == "__main__":
+    # запуск раз в сутки (cron): python retention.py
+    print(apply_retention())
@@ -0,0 +1,52 @@
+# price_spy-main/routes/analytics_routes.py
+# analytics тянет NumPy, поэтому импортируется в обработчиках, а не при старте API
+
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from auth import User, require_user, require_admin
+from schemas import PriceMetric, AnalyticsSummary, AlertRuleCreate, AlertRule, PriceAlert
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.post("/recompute", response_model=AnalyticsSummary)
+async def recompute_metrics(
+    day: Optional[date] = None,
+    window_days: Optional[int] = None,
+    u: User = Depends(require_admin),
+):
+    from analytics import WINDOW_DAYS, compute_price_metrics
+    return await compute_price_metrics(day, WINDOW_DAYS if window_days is None else window_days)
+
+@router.get("/movers", response_model=List[PriceMetric])
+async def read_movers(
+    threshold: float = 5.0,
+    day: Optional[date] = None,
+    competitor_id: Optional[int] = None,
+    limit: int = 100,
+    u: User = Depends(require_user),
+):
+    from analytics import get_price_movers
+    return await get_price_movers(threshold, day, competitor_id, limit)
+
+@router.get("/alerts", response_model=List[PriceAlert])
+async def read_alerts(day: Optional[date] = None, u: User = Depends(require_user)):
+    from analytics import evaluate_alerts
+    return await evaluate_alerts(day)
+
+@router.get("/alerts/rules", response_model=List[AlertRule])
+async def read_alert_rules(u: User = Depends(require_user)):
+    from analytics import get_alert_rules
+    return await get_alert_rules()
+
+@router.post("/alerts/rules", response_model=AlertRule)
+async def write_alert_rule(rule: AlertRuleCreate, u: User = Depends(require_admin)):
+    from analytics import create_alert_rule
+    return await create_alert_rule(rule)
+
+@router.delete("/alerts/rules/{rule_id}")
+async def remove_alert_rule(rule_id: int, u: User = Depends(require_admin)):
+    from analytics import delete_alert_rule
+    await delete_alert_rule(rule_id)
+    return {"status": "deleted"}
@@ -1,7 +1,8 @@
 # price_spy-main/routes/ozon_routes.py
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from typing import List
+from auth import User, require_admin
 from crud import create_price_record_from_ozon, fetch_all_ozon_prices
 from schemas import PriceRecord
 
@@ -14,3 +15,8 @@ async def fetch_ozon_price(product_id: int):
 @router.post("/products/fetch_all", response_model=List[PriceRecord])
 async def fetch_ozon_all():
     return await fetch_all_ozon_prices()
+
+@router.get("/cache/stats")
+async def scrape_cache_stats(u: User = Depends(require_admin)):
+    from parsers.scrape_cache import get_scrape_cache
+    return get_scrape_cache().stats()
@@ -1,13 +1,27 @@
-from fastapi import APIRouter
-from crud import get_price_records, create_price_record
-from schemas import PriceRecordCreate, PriceRecord
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from auth import User, require_user, require_admin
+from crud import get_price_records_by_product, get_price_history, create_price_record
+from schemas import PriceRecordCreate, PriceRecord, PriceHistoryPoint
 
 router = APIRouter(prefix="/prices", tags=["prices"])
 
-@router.get("/")
-async def read_prices(product_id: int):
-    return await get_price_records(product_id)
+@router.get("/", response_model=List[PriceRecord])
+async def read_prices(product_id: int, u: User = Depends(require_user)):
+    return await get_price_records_by_product(product_id)
+
+@router.get("/history", response_model=List[PriceHistoryPoint])
+async def read_price_history(
+    product_id: int,
+    start: date,
+    end: date,
+    competitor_id: Optional[int] = None,
+    u: User = Depends(require_user),
+):
+    return await get_price_history(product_id, start, end, competitor_id)
 
 @router.post("/", response_model=PriceRecord)
-async def write_price_record(record: PriceRecordCreate):
-    return await create_price_record(record)
\ No newline at end of file
+async def write_price_record(record: PriceRecordCreate, u: User = Depends(require_admin)):
+    return await create_price_record(record)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Literal
 from datetime import date
 
 class ProductCreate(BaseModel):
@@ -8,9 +8,20 @@ class ProductCreate(BaseModel):
 
 class Product(ProductCreate):
     id: int
+    url: Optional[str] = None
     class Config:
         from_attributes = True
 
+class ProductBulkCreate(BaseModel):
+    names: list[str]
+    fetch_prices: bool = False
+
+class ProductBulkResult(BaseModel):
+    created: list[Product]
+    skipped: list[str]          # уже были в базе
+    duplicates_in_input: int    # повторы внутри самого запроса (после нормализации)
+    enqueued: int = 0           # задач на получение цен поставлено в очередь
+
 class CompetitorCreate(BaseModel):
     name: str
 
@@ -29,6 +40,56 @@ class PriceRecordCreate(PriceRecordBase):
     pass
 
 class PriceRecord(PriceRecordBase):
+    id: Optional[int] = None   # None — точка восстановлена из агрегатов (retention.py)
+    valid_to: Optional[date] = None
+    class Config:
+        from_attributes = True
+
+class PriceHistoryPoint(BaseModel):
+    product_id: int
+    competitor_id: int
+    date: date
+    price_min: float
+    price_max: float
+    price_avg: float
+    price_last: float
+    samples: int
+    resolution: Literal["raw", "daily", "weekly"]
+
+class PriceMetric(BaseModel):
+    product_id: int
+    competitor_id: int
+    date: date
+    price: float
+    change_pct: Optional[float] = None
+    rolling_avg: Optional[float] = None
+    percentile_rank: Optional[float] = None
+    price_index: Optional[float] = None
+    class Config:
+        from_attributes = True
+
+class AnalyticsSummary(BaseModel):
+    date: date
+    window_days: int
+    products: int
+    competitors: int
+    metrics_stored: int
+    change_p05: Optional[float] = None
+    change_p50: Optional[float] = None
+    change_p95: Optional[float] = None
+    elapsed_sec: float
+
+class AlertRuleCreate(BaseModel):
+    name: str
+    competitor_id: Optional[int] = None
+    threshold_pct: float
+    direction: Literal["up", "down", "any"] = "any"
+
+class AlertRule(AlertRuleCreate):
     id: int
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PriceAlert(PriceMetric):
+    rule_id: int
+    rule_name: str
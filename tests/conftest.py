@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+# модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import metadata
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Отдельная SQLite-база со всеми таблицами на каждый тест."""
+    eng = create_engine(f"sqlite:///{tmp_path / 'test.sqlite3'}")
+    metadata.create_all(eng)
+    yield eng
+    eng.dispose()
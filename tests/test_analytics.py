@@ -0,0 +1,225 @@
+import asyncio
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from databases import Database
+from fastapi import HTTPException
+from sqlalchemy import select, func
+
+import analytics
+from models import (
+    products, competitors, price_records, price_rollups_daily, price_rollups_weekly,
+    alert_rules, price_metrics,
+)
+from schemas import AlertRuleCreate
+
+START = date(2026, 10, 5)    # понедельник
+END   = START + timedelta(days=13)
+NAN   = np.nan
+
+
+def day(n: int) -> date:
+    return START + timedelta(days=n)
+
+
+def record(product_id, price, first, last=None, competitor_id=1):
+    return {"product_id": product_id, "competitor_id": competitor_id, "price": price,
+            "date": day(first), "valid_to": day(last if last is not None else first)}
+
+
+def rollup(product_id, price, period, competitor_id=1):
+    return {"product_id": product_id, "competitor_id": competitor_id, "period_start": day(period),
+            "price_min": price, "price_max": price, "price_avg": price, "price_last": price, "samples": 1}
+
+
+# ----------------------------
+# Загрузка матрицы цен
+# ----------------------------
+
+def test_price_matrix_expands_intervals_and_clips_to_window(engine):
+    with engine.begin() as conn:
+        conn.execute(price_records.insert(), [
+            record(2, 20.0, -3, 1),      # начался до окна
+            record(1, 10.0, 12, 30),     # заканчивается после окна
+            record(1, 99.0, 0, 0, competitor_id=2),
+        ])
+        product_ids, matrix = analytics.load_price_matrix(conn, 1, START, END)
+    assert product_ids.tolist() == [1, 2]
+    assert matrix.dtype == np.float32 and matrix.shape == (2, 14)
+    np.testing.assert_array_equal(matrix[0], [NAN] * 12 + [10.0, 10.0])
+    np.testing.assert_array_equal(matrix[1], [20.0, 20.0] + [NAN] * 12)
+
+
+def test_price_matrix_latest_record_wins(engine):
+    with engine.begin() as conn:
+        conn.execute(price_records.insert(), [
+            record(1, 10.0, 0, 13),
+            record(1, 11.0, 2, 3),       # позже по id — перекрывает дни 2-3
+            record(1, 12.0, 3),
+        ])
+        _, matrix = analytics.load_price_matrix(conn, 1, START, END)
+    np.testing.assert_array_equal(matrix[0], [10.0, 10.0, 11.0, 12.0] + [10.0] * 10)
+
+
+def test_price_matrix_raw_overrides_rollups(engine):
+    with engine.begin() as conn:
+        conn.execute(price_rollups_weekly.insert(), [rollup(1, 5.0, 0)])
+        conn.execute(price_rollups_daily.insert(), [rollup(1, 6.0, 1), rollup(1, 6.5, 7)])
+        # id в разных таблицах не сравниваются: сырая запись детальнее агрегатов
+        conn.execute(price_records.insert(), [record(1, 7.0, 2, 7)])
+        _, matrix = analytics.load_price_matrix(conn, 1, START, END)
+    np.testing.assert_array_equal(matrix[0], [5.0, 6.0] + [7.0] * 6 + [NAN] * 6)
+
+
+def test_price_matrix_weekly_rollup_started_before_window(engine):
+    # неделя началась до окна, но её конец попадает в окно
+    with engine.begin() as conn:
+        conn.execute(price_rollups_weekly.insert(), [rollup(1, 5.0, 0), rollup(1, 4.0, -7)])
+        _, matrix = analytics.load_price_matrix(conn, 1, START + timedelta(days=3), END)
+    np.testing.assert_array_equal(matrix[0], [5.0] * 4 + [NAN] * 7)
+
+
+def test_price_matrix_empty(engine):
+    with engine.begin() as conn:
+        product_ids, matrix = analytics.load_price_matrix(conn, 1, START, END)
+    assert product_ids.size == 0 and matrix.shape == (0, 14)
+
+
+# ----------------------------
+# Векторные примитивы
+# ----------------------------
+
+def test_forward_fill():
+    matrix = np.array([[NAN, 1.0, NAN, 2.0, NAN], [NAN] * 5], dtype=np.float32)
+    np.testing.assert_array_equal(
+        analytics.forward_fill(matrix), [[NAN, 1.0, 1.0, 2.0, 2.0], [NAN] * 5]
+    )
+
+
+def test_trailing_mean_skips_nan():
+    matrix = np.array([
+        [1.0, 100.0, 2.0, NAN, 4.0],
+        [5.0, NAN, NAN, NAN, NAN],
+    ], dtype=np.float32)
+    np.testing.assert_allclose(analytics.trailing_mean(matrix, 3), [3.0, NAN])
+    # окно длиннее истории — среднее по всем дням
+    np.testing.assert_allclose(analytics.trailing_mean(matrix, 10), [26.75, 5.0])
+
+
+def test_change_pct():
+    prev = np.array([100.0, 80.0, 0.0, NAN])
+    cur  = np.array([110.0, 60.0, 5.0, 5.0])
+    np.testing.assert_allclose(analytics.change_pct(prev, cur), [10.0, -25.0, NAN, NAN])
+
+
+def test_percentile_rank():
+    matrix = np.array([
+        [10.0, 20.0, 30.0, 40.0],
+        [NAN, 5.0, NAN, 5.0],
+        [NAN, NAN, NAN, NAN],
+    ])
+    cur = np.array([20.0, 5.0, NAN])
+    np.testing.assert_allclose(analytics.percentile_rank(matrix, cur), [50.0, 100.0, NAN])
+
+
+def test_price_index():
+    per_competitor = {
+        1: {"product_ids": np.array([1, 2]), "price": np.array([110.0, 50.0])},
+        2: {"product_ids": np.array([1, 3]), "price": np.array([90.0, NAN])},
+    }
+    index = analytics._price_index(per_competitor)
+    np.testing.assert_allclose(index[1], [110.0, 100.0])
+    np.testing.assert_allclose(index[2], [90.0, NAN])
+
+
+def test_price_index_without_competitors():
+    assert analytics._price_index({}) == {}
+
+
+# ----------------------------
+# Расчёт метрик и алерты
+# ----------------------------
+
+@pytest.fixture
+def priced(engine, monkeypatch):
+    """Две недели истории: конкурент 1 — товары 1-3, конкурент 2 — товар 1."""
+    monkeypatch.setattr(analytics, "engine", engine)
+    with engine.begin() as conn:
+        conn.execute(competitors.insert(), [{"id": 1, "name": "Ozon"}, {"id": 2, "name": "WB"}])
+        conn.execute(products.insert(), [{"id": i, "name": f"товар {i}"} for i in (1, 2, 3)])
+        conn.execute(price_records.insert(), [
+            record(1, 120.0, 0, 6),
+            record(1, 100.0, 7, 12),
+            record(1, 110.0, 13),
+            record(2, 50.0, 13),                      # первая цена — в последний день
+            record(3, 40.0, 0, 2),                    # цена давно не обновлялась
+            record(1, 90.0, 0, 13, competitor_id=2),
+        ])
+    return engine
+
+
+def metrics_by_key(engine) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(price_metrics.select()).mappings().all()
+    return {(r["competitor_id"], r["product_id"]): r for r in rows}
+
+
+def test_compute_price_metrics(priced):
+    summary = asyncio.run(analytics.compute_price_metrics(END, window_days=14))
+    assert (summary.products, summary.competitors, summary.metrics_stored) == (3, 2, 4)
+    assert (summary.change_p05, summary.change_p50, summary.change_p95) == (0.0, 0.0, 9.0)
+
+    metrics = metrics_by_key(priced)
+    assert set(metrics) == {(1, 1), (1, 2), (1, 3), (2, 1)}
+    m = metrics[(1, 1)]
+    assert (m["date"], m["price"], m["change_pct"], m["percentile_rank"], m["price_index"]) == (
+        END, 110.0, 10.0, 50.0, 110.0)
+    assert m["rolling_avg"] == pytest.approx((6 * 100.0 + 110.0) / 7, abs=1e-4)
+
+    new = metrics[(1, 2)]
+    assert (new["change_pct"], new["rolling_avg"], new["price_index"]) == (None, 50.0, 100.0)
+    stale = metrics[(1, 3)]
+    assert (stale["price"], stale["change_pct"], stale["rolling_avg"]) == (40.0, 0.0, None)
+    assert metrics[(2, 1)]["price_index"] == 90.0
+
+
+def test_recompute_replaces_metrics_for_the_day(priced):
+    asyncio.run(analytics.compute_price_metrics(END, window_days=14))
+    asyncio.run(analytics.compute_price_metrics(END, window_days=14))
+    with priced.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(price_metrics)).scalar() == 4
+
+
+@pytest.mark.parametrize("window_days", [0, 1])
+def test_compute_price_metrics_rejects_short_window(window_days):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(analytics.compute_price_metrics(END, window_days=window_days))
+    assert exc.value.status_code == 400
+
+
+def test_evaluate_alerts(priced, tmp_path, monkeypatch):
+    db = Database(f"sqlite:///{tmp_path / 'test.sqlite3'}")
+    monkeypatch.setattr(analytics, "database", db)
+    asyncio.run(analytics.compute_price_metrics(END, window_days=14))
+    with priced.begin() as conn:
+        conn.execute(alert_rules.insert(), [
+            AlertRuleCreate(name="рост", threshold_pct=5, direction="up").model_dump(),
+            AlertRuleCreate(name="падение у WB", competitor_id=2, threshold_pct=1, direction="down").model_dump(),
+            AlertRuleCreate(name="любое у Ozon", competitor_id=1, threshold_pct=0).model_dump(),
+        ])
+
+    async def scenario():
+        await db.connect()
+        try:
+            return await analytics.evaluate_alerts(), await analytics.evaluate_alerts(END - timedelta(days=1))
+        finally:
+            await db.disconnect()
+
+    alerts, other_day = asyncio.run(scenario())
+    assert [(a.rule_name, a.competitor_id, a.product_id, a.change_pct) for a in alerts] == [
+        ("рост", 1, 1, 10.0),
+        ("любое у Ozon", 1, 1, 10.0),
+        ("любое у Ozon", 1, 3, 0.0),     # товар 2 без вчерашней цены не срабатывает
+    ]
+    assert other_day == []
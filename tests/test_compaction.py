@@ -0,0 +1,135 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import compaction
+from models import price_records
+
+DAY = date(2026, 3, 2)
+
+
+def day(n: int) -> date:
+    return DAY + timedelta(days=n)
+
+
+def insert_daily(conn, product_id, competitor_id, prices, start=0):
+    """Режим "append": одна запись на каждый день, valid_to = date."""
+    conn.execute(price_records.insert(), [
+        {"product_id": product_id, "competitor_id": competitor_id,
+         "price": p, "date": day(start + i), "valid_to": day(start + i)}
+        for i, p in enumerate(prices)
+    ])
+
+
+def daily_series(conn) -> dict:
+    """{(товар, конкурент, день): цена} — история, развёрнутая по дням."""
+    series = {}
+    rows = conn.execute(select(price_records).order_by(price_records.c.id)).fetchall()
+    for r in rows:
+        d = r.date
+        while d <= (r.valid_to or r.date):
+            series[(r.product_id, r.competitor_id, d)] = r.price
+            d += timedelta(days=1)
+    return series
+
+
+def intervals(conn, product_id, competitor_id) -> list[tuple]:
+    rows = conn.execute(
+        select(price_records.c.price, price_records.c.date, price_records.c.valid_to)
+        .where(price_records.c.product_id == product_id)
+        .where(price_records.c.competitor_id == competitor_id)
+        .order_by(price_records.c.date)
+    ).fetchall()
+    return [tuple(r) for r in rows]
+
+
+@pytest.fixture
+def compact(engine, monkeypatch):
+    monkeypatch.setattr(compaction, "engine", engine)
+    return compaction.compact_price_records
+
+
+def test_merges_runs_of_equal_prices(engine, compact):
+    with engine.begin() as conn:
+        insert_daily(conn, 1, 1, [10, 10, 10, 12, 12, 10])
+
+    result = compact()
+
+    assert result["merged_runs"] == 2
+    assert result["deleted_rows"] == 3
+    with engine.connect() as conn:
+        assert intervals(conn, 1, 1) == [
+            (10, day(0), day(2)),
+            (12, day(3), day(4)),
+            (10, day(5), day(5)),
+        ]
+
+
+def test_compacted_history_expands_to_same_daily_series(engine, compact):
+    with engine.begin() as conn:
+        insert_daily(conn, 1, 1, [5, 5, 6, 6, 6, 5, 5])
+        insert_daily(conn, 1, 2, [7, 7, 7, 7])
+        insert_daily(conn, 2, 1, [9, 8, 8, 9], start=2)
+        # та же цена после пропуска: две точки, а не интервал на 60 дней
+        insert_daily(conn, 3, 1, [10])
+        insert_daily(conn, 3, 1, [10], start=59)
+        insert_daily(conn, 3, 1, [10, 10], start=61)
+        before = daily_series(conn)
+
+    compact()
+
+    with engine.connect() as conn:
+        assert daily_series(conn) == before
+        gaps = conn.execute(
+            select(price_records.c.date, price_records.c.valid_to)
+            .where(price_records.c.product_id == 3)
+            .order_by(price_records.c.date)
+        ).fetchall()
+    assert [tuple(r) for r in gaps] == [(day(0), day(0)), (day(59), day(59)), (day(61), day(62))]
+
+
+def test_does_not_merge_across_products_or_competitors(engine, compact):
+    with engine.begin() as conn:
+        insert_daily(conn, 1, 1, [10])
+        insert_daily(conn, 1, 2, [10])
+        insert_daily(conn, 2, 1, [10])
+
+    result = compact()
+
+    assert result == {"merged_runs": 0, "deleted_rows": 0, "elapsed_sec": result["elapsed_sec"]}
+    with engine.connect() as conn:
+        assert len(conn.execute(select(price_records)).fetchall()) == 3
+
+
+def test_extends_existing_interval_with_following_run(engine, compact):
+    with engine.begin() as conn:
+        conn.execute(price_records.insert(), [
+            {"product_id": 1, "competitor_id": 1, "price": 10, "date": day(0), "valid_to": day(3)},
+            {"product_id": 1, "competitor_id": 1, "price": 10, "date": day(4), "valid_to": day(6)},
+            {"product_id": 1, "competitor_id": 1, "price": 10, "date": day(7), "valid_to": None},
+        ])
+
+    compact()
+
+    with engine.connect() as conn:
+        assert intervals(conn, 1, 1) == [(10, day(0), day(7))]
+
+
+def test_processes_products_in_chunks(engine, compact, monkeypatch):
+    monkeypatch.setattr(compaction, "PRODUCT_CHUNK", 2)
+    with engine.begin() as conn:
+        for pid in range(1, 6):
+            insert_daily(conn, pid, 1, [pid, pid, pid + 1])
+
+    result = compact()
+
+    assert result["merged_runs"] == 5
+    assert result["deleted_rows"] == 5
+    with engine.connect() as conn:
+        for pid in range(1, 6):
+            assert intervals(conn, pid, 1) == [(pid, day(0), day(1)), (pid + 1, day(2), day(2))]
+
+
+def test_empty_table(compact):
+    assert compact()["merged_runs"] == 0
@@ -0,0 +1,221 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import coordination as c
+
+WORKER_A = "host:1:aaaaaa"
+WORKER_B = "host:2:bbbbbb"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def r():
+    # CLAIM_SCRIPT — Lua, fakeredis выполняет его через lupa
+    return fakeredis.aioredis.FakeRedis()
+
+
+async def queue(r):
+    return [t.decode() for t in await r.lrange(c.QUEUE_KEY, 0, -1)]
+
+
+async def processing(r):
+    return [t.decode() for t in await r.lrange(c.PROCESSING_KEY, 0, -1)]
+
+
+def test_enqueue_makes_unique_tokens(r):
+    async def scenario():
+        assert await c.enqueue_tasks(r, [7, 7, 8], batch=2) == 3
+        return await queue(r)
+
+    tasks = run(scenario())
+    assert len(set(tasks)) == 3
+    assert [c.task_product_id(t) for t in tasks] == [7, 7, 8]
+
+
+def test_task_product_id_accepts_bare_ids():
+    assert c.task_product_id(b"42") == 42
+    assert c.task_product_id("42:abc") == 42
+
+
+def test_claim_moves_task_and_sets_lease(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.enqueue_tasks(r, [5])
+        task = await c.claim_task(r, WORKER_A)
+        lease = await r.get(c.LEASE_PREFIX + task.decode())
+        ttl = await r.ttl(c.LEASE_PREFIX + task.decode())
+        worker = await r.hgetall(c.WORKER_PREFIX + WORKER_A)
+        return task, lease, ttl, worker, await queue(r), await processing(r)
+
+    task, lease, ttl, worker, queued, in_flight = run(scenario())
+    assert c.task_product_id(task) == 5
+    assert lease.decode() == WORKER_A
+    assert 0 < ttl <= c.LEASE_TTL
+    assert worker[b"status"] == b"busy" and worker[b"task"] == task
+    assert queued == [] and in_flight == [task.decode()]
+
+
+def test_claim_from_empty_queue(r):
+    assert run(c.claim_task(r, WORKER_A)) is None
+
+
+def test_duplicate_product_has_independent_leases(r):
+    async def scenario():
+        await c.enqueue_tasks(r, [7, 7])
+        task_a = await c.claim_task(r, WORKER_A)
+        task_b = await c.claim_task(r, WORKER_B)
+        await c.complete_task(r, WORKER_A, task_a, ok=True)
+        reclaimed = await c.reclaim_expired(r)
+        lease_b = await r.get(c.LEASE_PREFIX + task_b.decode())
+        return task_a, task_b, reclaimed, lease_b, await queue(r), await processing(r)
+
+    task_a, task_b, reclaimed, lease_b, queued, in_flight = run(scenario())
+    assert task_a != task_b
+    assert reclaimed == 0
+    assert lease_b.decode() == WORKER_B
+    assert queued == [] and in_flight == [task_b.decode()]
+
+
+def test_reclaim_returns_expired_task_to_queue_head(r):
+    async def scenario():
+        await c.enqueue_tasks(r, [1, 2])
+        task = await c.claim_task(r, WORKER_A)
+        await r.delete(c.LEASE_PREFIX + task.decode())   # воркер умер, аренда истекла
+        reclaimed = await c.reclaim_expired(r)
+        return task, reclaimed, await queue(r), await processing(r)
+
+    task, reclaimed, queued, in_flight = run(scenario())
+    assert reclaimed == 1
+    assert queued[0] == task.decode() and len(queued) == 2
+    assert in_flight == []
+
+
+def test_heartbeat_extends_lease(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.enqueue_tasks(r, [1])
+        task = await c.claim_task(r, WORKER_A)
+        key = c.LEASE_PREFIX + task.decode()
+        await r.expire(key, 1)
+        await c.heartbeat(r, WORKER_A, task)
+        return await r.ttl(key), await r.ttl(c.WORKER_PREFIX + WORKER_A)
+
+    lease_ttl, worker_ttl = run(scenario())
+    assert lease_ttl > 1
+    assert 0 < worker_ttl <= c.WORKER_TTL
+
+
+def test_complete_updates_counters(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.enqueue_tasks(r, [1, 2])
+        await c.complete_task(r, WORKER_A, await c.claim_task(r, WORKER_A), ok=True)
+        await c.complete_task(r, WORKER_A, await c.claim_task(r, WORKER_A), ok=False)
+        worker = await r.hgetall(c.WORKER_PREFIX + WORKER_A)
+        done = await r.get(f"{c.DONE_PREFIX}{c._minute()}")
+        return worker, done, await processing(r)
+
+    worker, done, in_flight = run(scenario())
+    assert worker[b"processed"] == b"1" and worker[b"failed"] == b"1"
+    assert worker[b"status"] == b"idle" and worker[b"task"] == b""
+    assert int(done) == 2
+    assert in_flight == []
+
+
+def test_list_workers_forgets_dead_workers(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.register_worker(r, WORKER_B)
+        await r.delete(c.WORKER_PREFIX + WORKER_B)      # heartbeat пропал
+        workers = await c.list_workers(r)
+        return workers, await r.smembers(c.WORKERS_KEY)
+
+    workers, members = run(scenario())
+    assert [w["id"] for w in workers] == [WORKER_A]
+    assert workers[0]["host"] == "host" and workers[0]["pid"] == 1
+    assert members == {WORKER_A.encode()}
+
+
+@pytest.mark.parametrize("backlog, enqueue_rate, task_sec, expected", [
+    (0, 0.0, None, c.MIN_WORKERS),
+    # без статистики: DEFAULT_TASK_SEC на задачу, очередь — за TARGET_DRAIN_SEC
+    (60, 0.0, None, 3),
+    # задача идёт 10 с (0.1 задачи/с на воркер), входящий поток 0.25/с
+    (0, 0.25, 10.0, 3),
+    (10**6, 0.0, None, c.MAX_WORKERS),
+])
+def test_desired_worker_count(monkeypatch, backlog, enqueue_rate, task_sec, expected):
+    monkeypatch.setattr(c, "TARGET_DRAIN_SEC", 600)
+    monkeypatch.setattr(c, "DEFAULT_TASK_SEC", 30.0)
+    assert c.desired_worker_count(backlog, enqueue_rate, task_sec) == expected
+
+
+@pytest.mark.parametrize("alive, enqueued, done, busy_sec, expected", [
+    # равновесие: 10 воркеров, 0.1 задачи/с приходит и уходит, задача — 10 с;
+    # нагрузки на 1 воркер, а не на 10
+    (10, 0.1, 0.1, 10.0, 1),
+    # то же при задаче в 45 с — нужно 5 воркеров
+    (10, 0.1, 0.1, 45.0, 5),
+    # длительностей ещё нет (старая статистика) — DEFAULT_TASK_SEC
+    (10, 0.1, 0.1, None, 3),
+    # один воркер, поток вдвое больше, чем он успевает
+    (1, 0.2, 0.1, 10.0, 2),
+])
+def test_desired_workers_follow_task_duration(monkeypatch, r, alive, enqueued, done, busy_sec, expected):
+    monkeypatch.setattr(c, "DEFAULT_TASK_SEC", 30.0)
+    window = c.RATE_WINDOW_MIN * 60
+
+    async def scenario():
+        for i in range(alive):
+            await c.register_worker(r, f"host:{i}:abcdef")
+        # статистика за окно лежит в одной минуте — важна только сумма
+        minute = c._minute() - 1
+        await r.set(f"{c.ENQUEUED_PREFIX}{minute}", round(enqueued * window))
+        await r.set(f"{c.DONE_PREFIX}{minute}", round(done * window))
+        if busy_sec is not None:
+            await r.set(f"{c.BUSY_PREFIX}{minute}", busy_sec * done * window)
+        return await c.cluster_status(r)
+
+    status = run(scenario())
+    assert status["alive"] == alive
+    assert status["desired_workers"] == expected
+
+
+def test_complete_task_records_busy_time(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.enqueue_tasks(r, [1])
+        task = await c.claim_task(r, WORKER_A)
+        # задачу взяли 42 с назад
+        claimed_at = float(await r.hget(c.WORKER_PREFIX + WORKER_A, "claimed_at"))
+        await r.hset(c.WORKER_PREFIX + WORKER_A, "claimed_at", claimed_at - 42)
+        await c.complete_task(r, WORKER_A, task, ok=True)
+        busy = await r.get(f"{c.BUSY_PREFIX}{c._minute()}")
+        return float(busy), await r.hget(c.WORKER_PREFIX + WORKER_A, "claimed_at")
+
+    busy, claimed_at = run(scenario())
+    assert busy == pytest.approx(42.0, abs=1.0)
+    assert claimed_at == b""
+
+
+def test_cluster_status_has_no_eta_while_queue_grows(r):
+    async def scenario():
+        await c.register_worker(r, WORKER_A)
+        await c.enqueue_tasks(r, [1, 2, 3])
+        # статистика за прошлую минуту: поставлено больше, чем сделано
+        minute = c._minute() - 1
+        await r.set(f"{c.ENQUEUED_PREFIX}{minute}", 600)
+        await r.set(f"{c.DONE_PREFIX}{minute}", 300)
+        return await c.cluster_status(r)
+
+    status = run(scenario())
+    assert status["alive"] == 1
+    assert status["backlog"] == 3
+    assert status["queue_growing"] is True
+    assert status["backlog_eta_sec"] is None
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from databases import Database
+from sqlalchemy import select
+
+import crud
+from models import products, price_records
+
+DAY = date(2026, 3, 2)
+
+
+def day(n: int) -> date:
+    return DAY + timedelta(days=n)
+
+
+@pytest.fixture
+def db(engine, monkeypatch):
+    """crud поверх тестовой базы; run(coro) выполняет корутину с подключением."""
+    database = Database(str(engine.url))
+    monkeypatch.setattr(crud, "database", database)
+
+    def run(coro):
+        async def scenario():
+            await database.connect()
+            try:
+                return await coro
+            finally:
+                await database.disconnect()
+        return asyncio.run(scenario())
+
+    return run
+
+
+def stored(engine) -> list[tuple]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(price_records.c.price, price_records.c.date, price_records.c.valid_to)
+            .order_by(price_records.c.id)
+        ).fetchall()
+    return [tuple(r) for r in rows]
+
+
+# ----------------------------
+# Запись цен
+# ----------------------------
+
+def test_store_price_extends_unchanged_price(engine, db, monkeypatch):
+    monkeypatch.setattr(crud, "PRICE_STORAGE_MODE", "changes")
+    results = [db(crud.store_price(1, 1, price, day(n))) for n, price in [(0, 10.0), (1, 10.0), (2, 12.0)]]
+    assert [created for _, created in results] == [True, False, True]
+    assert stored(engine) == [(10.0, day(0), day(1)), (12.0, day(2), day(2))]
+
+
+def test_store_price_starts_new_interval_after_gap(engine, db, monkeypatch):
+    monkeypatch.setattr(crud, "PRICE_STORAGE_MODE", "changes")
+    for n in (0, 1, 5):
+        db(crud.store_price(1, 1, 10.0, day(n)))
+    assert stored(engine) == [(10.0, day(0), day(1)), (10.0, day(5), day(5))]
+
+
+def test_store_price_append_mode(engine, db, monkeypatch):
+    monkeypatch.setattr(crud, "PRICE_STORAGE_MODE", "append")
+    for n in (0, 1):
+        db(crud.store_price(1, 1, 10.0, day(n)))
+    assert stored(engine) == [(10.0, day(0), day(0)), (10.0, day(1), day(1))]
+
+
+# ----------------------------
+# Массовый импорт товаров
+# ----------------------------
+
+@pytest.mark.parametrize("filename, content, expected", [
+    ("names.json", '["Чайник", {"name": "Утюг"}]', ["Чайник", "Утюг"]),
+    ("names.csv", "name,price\nЧайник,100\nУтюг,200\n", ["Чайник", "Утюг"]),
+    ("names.csv", "Название,Цена\nЧайник,100\n\nУтюг\n", ["Чайник", "Утюг"]),
+    ("names.csv", "sku,Query\n1,Чайник\n2\n", ["Чайник"]),
+    # одна колонка без заголовка — все строки названия
+    ("names.txt", "Чайник\nУтюг\n", ["Чайник", "Утюг"]),
+    ("names.csv", "\ufeffname\nЧайник\n", ["Чайник"]),            # BOM из Excel
+    ("names.csv", "", []),
+])
+def test_parse_product_names(filename, content, expected):
+    assert crud.parse_product_names(filename, content.encode("utf-8")) == expected
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("names.json", '{"name": "Чайник"}'),
+    ("names.json", '["Чайник", 42]'),
+    ("names.json", '[{"title": "Чайник"}]'),
+    ("names.json", "[не json"),
+    # несколько колонок без колонки названия: неясно, заголовок ли первая строка
+    ("names.csv", "Артикул,Цена\n1,100\n"),
+    # поле длиннее csv.field_size_limit — csv.Error
+    ("names.csv", '"' + "x" * 200_000 + '"\n'),
+])
+def test_parse_product_names_rejects_bad_files(filename, content):
+    with pytest.raises(ValueError):
+        crud.parse_product_names(filename, content.encode("utf-8"))
+
+
+def test_parse_product_names_rejects_bad_encoding():
+    with pytest.raises(ValueError):
+        crud.parse_product_names("names.csv", "Чайник".encode("cp1251"))
+
+
+def test_bulk_create_products(engine, db, monkeypatch):
+    monkeypatch.setattr(crud, "BULK_BATCH", 2)
+    db(crud.bulk_create_products(["Утюг"]))
+
+    result = db(crud.bulk_create_products(
+        ["  Чайник  электрический", "Утюг", "Чайник электрический", "", "   ", "Миксер", "Утюг", "Тостер"]
+    ))
+    assert [p.name for p in result.created] == ["Чайник электрический", "Миксер", "Тостер"]
+    assert result.skipped == ["Утюг"]
+    assert result.duplicates_in_input == 2
+
+    with engine.connect() as conn:
+        names = conn.execute(select(products.c.name).order_by(products.c.id)).scalars().all()
+    assert names == ["Утюг", "Чайник электрический", "Миксер", "Тостер"]
@@ -0,0 +1,219 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import select, func
+
+import analytics
+import retention
+from models import price_records, price_rollups_daily, price_rollups_weekly
+from price_history import expand_intervals
+
+TODAY = date(2026, 10, 19)
+
+
+def days(*values):
+    return np.array(values, dtype="datetime64[D]")
+
+
+# ----------------------------
+# Векторные помощники
+# ----------------------------
+
+def test_expand_intervals_dates():
+    rec, expanded = expand_intervals(days("2026-01-30", "2026-02-05"), days("2026-02-01", "2026-02-05"))
+    assert rec.tolist() == [0, 0, 0, 1]
+    assert expanded.tolist() == [date(2026, 1, 30), date(2026, 1, 31), date(2026, 2, 1), date(2026, 2, 5)]
+
+
+def test_expand_intervals_day_numbers():
+    rec, expanded = expand_intervals(np.array([0, 5]), np.array([1, 7]))
+    assert rec.tolist() == [0, 0, 1, 1, 1]
+    assert expanded.tolist() == [0, 1, 5, 6, 7]
+
+
+@pytest.mark.parametrize("day, monday", [
+    ("2026-10-19", "2026-10-19"),   # понедельник
+    ("2026-10-25", "2026-10-19"),   # воскресенье
+    ("2026-10-22", "2026-10-19"),
+    ("1970-01-01", "1969-12-29"),
+    ("1969-12-28", "1969-12-22"),
+])
+def test_to_week_start(day, monday):
+    assert retention.to_week_start(days(day)).tolist() == days(monday).tolist()
+    assert retention.week_start(date.fromisoformat(day)) == date.fromisoformat(monday)
+
+
+def test_aggregate_groups_by_product_competitor_period():
+    agg = retention.aggregate(
+        product_ids=np.array([1, 1, 1, 2]),
+        competitor_ids=np.array([1, 1, 1, 1]),
+        periods=days("2026-10-19", "2026-10-19", "2026-10-20", "2026-10-19"),
+        order=np.array([2, 1, 3, 4]),
+        price_min=np.array([10.0, 30.0, 5.0, 7.0]),
+        price_max=np.array([10.0, 30.0, 5.0, 7.0]),
+        price_sum=np.array([10.0, 30.0, 5.0, 7.0]),
+        samples=np.array([1, 1, 1, 1]),
+        price_last=np.array([10.0, 30.0, 5.0, 7.0]),
+    )
+    rows = retention.as_rows(agg)
+    assert [(r["product_id"], r["period_start"]) for r in rows] == [
+        (1, date(2026, 10, 19)), (1, date(2026, 10, 20)), (2, date(2026, 10, 19)),
+    ]
+    first = rows[0]
+    assert (first["price_min"], first["price_max"], first["price_avg"]) == (10.0, 30.0, 20.0)
+    assert first["price_last"] == 10.0   # order 2 позже order 1
+    assert first["samples"] == 2
+
+
+def test_aggregate_raw_expands_intervals_and_takes_last_by_id():
+    rows = [
+        (1, 1, 1, 100.0, "2026-10-19", "2026-10-21"),
+        (2, 1, 1, 90.0, "2026-10-21", "2026-10-21"),
+    ]
+    result = retention.as_rows(retention.aggregate_raw(rows, "daily"))
+    assert [(r["period_start"], r["price_last"], r["samples"]) for r in result] == [
+        (date(2026, 10, 19), 100.0, 1),
+        (date(2026, 10, 20), 100.0, 1),
+        (date(2026, 10, 21), 90.0, 2),
+    ]
+    assert result[2]["price_min"] == 90.0 and result[2]["price_max"] == 100.0
+
+
+def test_aggregate_rollups_keeps_sample_counts_and_weighted_average():
+    rows = [
+        (1, 1, date(2026, 10, 19), 10.0, 20.0, 15.0, 20.0, 4),
+        (1, 1, date(2026, 10, 21), 5.0, 8.0, 6.0, 8.0, 2),
+        (1, 1, date(2026, 10, 26), 1.0, 1.0, 1.0, 1.0, 1),
+    ]
+    result = retention.as_rows(retention.aggregate_rollups(rows, "weekly"))
+    assert len(result) == 2
+    week = result[0]
+    assert week["period_start"] == date(2026, 10, 19)
+    assert week["samples"] == 6
+    assert week["price_avg"] == pytest.approx((15.0 * 4 + 6.0 * 2) / 6)
+    assert (week["price_min"], week["price_max"], week["price_last"]) == (5.0, 20.0, 8.0)
+    assert sum(r["samples"] for r in result) == sum(r[-1] for r in rows)
+
+
+# ----------------------------
+# Выбор разрешения
+# ----------------------------
+
+def test_choose_resolution_boundaries():
+    raw_from = retention.raw_cutoff(TODAY)
+    daily_from = retention.daily_cutoff(TODAY)
+    raw_span = timedelta(days=retention.RAW_RETENTION_DAYS)
+    daily_span = timedelta(days=retention.DAILY_RETENTION_DAYS)
+
+    assert retention.choose_resolution(raw_from, raw_from + raw_span, TODAY) == "raw"
+    assert retention.choose_resolution(raw_from - timedelta(days=1), TODAY, TODAY) == "daily"
+    assert retention.choose_resolution(raw_from, raw_from + raw_span + timedelta(days=1), TODAY) == "daily"
+    assert retention.choose_resolution(daily_from, daily_from + daily_span, TODAY) == "daily"
+    assert retention.choose_resolution(daily_from - timedelta(days=1), TODAY, TODAY) == "weekly"
+    assert retention.choose_resolution(daily_from, daily_from + daily_span + timedelta(days=1), TODAY) == "weekly"
+
+
+def test_daily_cutoff_is_monday():
+    assert retention.daily_cutoff(TODAY).weekday() == 0
+
+
+# ----------------------------
+# Сворачивание в базе
+# ----------------------------
+
+HISTORY_DAYS = 1001
+
+
+@pytest.fixture
+def history(engine, monkeypatch):
+    """Ежедневная цена одного товара за HISTORY_DAYS дней до TODAY."""
+    monkeypatch.setattr(retention, "engine", engine)
+    with engine.begin() as conn:
+        conn.execute(price_records.insert(), [
+            {"product_id": 1, "competitor_id": 1, "price": 100.0 + i % 7,
+             "date": TODAY - timedelta(days=i), "valid_to": TODAY - timedelta(days=i)}
+            for i in range(HISTORY_DAYS)
+        ])
+    return engine
+
+
+def total_samples(conn, table):
+    return conn.execute(select(func.coalesce(func.sum(table.c.samples), 0))).scalar()
+
+
+def test_apply_retention_moves_old_days_to_rollups(history):
+    result = retention.apply_retention(TODAY)
+
+    raw_from, daily_from = retention.raw_cutoff(TODAY), retention.daily_cutoff(TODAY)
+    with history.connect() as conn:
+        raw_days = conn.execute(select(func.count()).select_from(price_records)).scalar()
+        oldest_raw = conn.execute(select(func.min(price_records.c.date))).scalar()
+        daily_range = conn.execute(
+            select(func.min(price_rollups_daily.c.period_start), func.max(price_rollups_daily.c.period_start))
+        ).one()
+        newest_weekly = conn.execute(select(func.max(price_rollups_weekly.c.period_start))).scalar()
+        # каждый исходный день учтён ровно один раз
+        assert raw_days + total_samples(conn, price_rollups_daily) + total_samples(conn, price_rollups_weekly) \
+            == HISTORY_DAYS
+
+    assert result["raw_rolled_up"] == HISTORY_DAYS - raw_days
+    assert oldest_raw == raw_from
+    assert daily_range == (daily_from, raw_from - timedelta(days=1))
+    assert newest_weekly < daily_from
+
+
+def test_apply_retention_is_idempotent(history):
+    retention.apply_retention(TODAY)
+    with history.connect() as conn:
+        before = [conn.execute(select(t)).fetchall() for t in (price_records, price_rollups_daily, price_rollups_weekly)]
+
+    result = retention.apply_retention(TODAY)
+
+    assert (result["raw_rolled_up"], result["daily_rolled_up"]) == (0, 0)
+    with history.connect() as conn:
+        after = [conn.execute(select(t)).fetchall() for t in (price_records, price_rollups_daily, price_rollups_weekly)]
+    assert after == before
+
+
+def test_interval_crossing_cutoff_is_shortened(engine, monkeypatch):
+    monkeypatch.setattr(retention, "engine", engine)
+    raw_from = retention.raw_cutoff(TODAY)
+    with engine.begin() as conn:
+        conn.execute(price_records.insert().values(
+            product_id=1, competitor_id=1, price=50.0,
+            date=raw_from - timedelta(days=3), valid_to=raw_from + timedelta(days=2),
+        ))
+
+    retention.apply_retention(TODAY)
+
+    with engine.connect() as conn:
+        raw = conn.execute(select(price_records.c.date, price_records.c.valid_to)).one()
+        assert tuple(raw) == (raw_from, raw_from + timedelta(days=2))
+        assert total_samples(conn, price_rollups_daily) == 3
+
+
+def test_rollups_merge_with_existing_period(engine):
+    row = {"product_id": 1, "competitor_id": 1, "period_start": TODAY,
+           "price_min": 10.0, "price_max": 10.0, "price_avg": 10.0, "price_last": 10.0, "samples": 1}
+    with engine.begin() as conn:
+        retention._upsert_rollups(conn, price_rollups_daily, [row])
+        retention._upsert_rollups(conn, price_rollups_daily, [
+            {**row, "price_min": 20.0, "price_max": 20.0, "price_avg": 20.0, "price_last": 20.0, "samples": 3},
+        ])
+        merged = conn.execute(select(price_rollups_daily)).one()
+    assert (merged.price_min, merged.price_max, merged.price_last, merged.samples) == (10.0, 20.0, 20.0, 4)
+    assert merged.price_avg == pytest.approx(17.5)
+
+
+def test_price_matrix_reads_rolled_up_days(history):
+    start = TODAY - timedelta(days=364)
+    with history.connect() as conn:
+        ids_before, before = analytics.load_price_matrix(conn, 1, start, TODAY)
+
+    retention.apply_retention(TODAY)
+
+    with history.connect() as conn:
+        ids_after, after = analytics.load_price_matrix(conn, 1, start, TODAY)
+    assert ids_after.tolist() == ids_before.tolist() == [1]
+    np.testing.assert_array_equal(after, before)
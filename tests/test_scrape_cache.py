@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from parsers.scrape_cache import ScrapeCache, content_hash
+
+URL = "https://www.ozon.ru/product/1/"
+PAGE = {"@type": "Product", "sku": "1", "offers": {"price": "100", "priceCurrency": "RUB"}}
+NEW_PAGE = {**PAGE, "offers": {"price": "120", "priceCurrency": "RUB"}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ScrapeCache(path=str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+
+def test_unknown_url_is_changed(cache):
+    assert cache.lookup(URL, PAGE) == (content_hash(PAGE), None)
+
+
+def test_same_page_returns_stored_price(cache):
+    digest, _ = cache.lookup(URL, PAGE)
+    cache.put(URL, digest, 100.0)
+    assert cache.lookup(URL, PAGE) == (digest, 100.0)
+
+
+def test_changed_page_is_not_a_hit(cache):
+    cache.put(URL, content_hash(PAGE), 100.0)
+    assert cache.lookup(URL, NEW_PAGE)[1] is None
+
+
+def test_page_without_put_stays_changed(cache):
+    # цена новой карточки не записалась в БД (сбой) — следующий парсинг
+    # не должен считать её неизменной
+    cache.put(URL, content_hash(PAGE), 100.0)
+    cache.lookup(URL, NEW_PAGE)
+    assert cache.lookup(URL, NEW_PAGE)[1] is None
+
+
+def test_lru_eviction(cache):
+    for i in range(3):
+        cache.put(f"{URL}{i}", content_hash(PAGE), 100.0)
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(f"{URL}0", PAGE)[1] is None
+    assert cache.lookup(f"{URL}2", PAGE)[1] == 100.0
+
+
+def test_stats(cache):
+    cache.lookup(URL, PAGE)
+    cache.put(URL, content_hash(PAGE), 100.0)
+    cache.lookup(URL, PAGE)
+    cache.lookup(URL, PAGE)
+    stats = cache.stats()
+    assert (stats["changed"], stats["unchanged"], stats["lookups"]) == (1, 2, 3)
+    assert stats["hit_rate"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_old_schema_is_replaced(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE entries (url TEXT PRIMARY KEY, payload TEXT NOT NULL)")
+    cache = ScrapeCache(path=path)
+    cache.put(URL, content_hash(PAGE), 100.0)
+    assert cache.lookup(URL, PAGE)[1] == 100.0
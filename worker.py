@@ -1,30 +1,70 @@
 # worker.py
 import asyncio
+import os
+import time
 import redis.asyncio as redis
-from crud import create_price_record_from_ozon
+from crud import scrape_ozon_price
 from database import database
+from events import publish_price_event
+from coordination import (
+    HEARTBEAT_INTERVAL, RECLAIM_INTERVAL,
+    new_worker_id, register_worker, unregister_worker,
+    heartbeat, claim_task, complete_task, reclaim_expired, task_product_id,
+)
 
-REDIS_URL = "redis://localhost:6379"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")  # тот же, что у API (main.py)
+
+async def heartbeat_loop(r, worker_id, state):
+    """Фоном: heartbeat воркера, продление аренды и возврат брошенных задач."""
+    last_reclaim = 0.0
+    while True:
+        try:
+            await heartbeat(r, worker_id, state["task"])
+            if time.monotonic() - last_reclaim >= RECLAIM_INTERVAL:
+                last_reclaim = time.monotonic()
+                reclaimed = await reclaim_expired(r)
+                if reclaimed:
+                    print(f"↩ Возвращено в очередь брошенных задач: {reclaimed}")
+        except Exception as e:
+            print(f"⚠ Ошибка heartbeat: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
 
 async def worker():
     r = redis.Redis.from_url(REDIS_URL)
-    print("Redis worker запущен. Ожидаем задач...")
+    worker_id = new_worker_id()
+    state = {"task": None}
+    await register_worker(r, worker_id)
+    beat = asyncio.create_task(heartbeat_loop(r, worker_id, state))
+    print(f"Redis worker {worker_id} запущен. Ожидаем задач...")
 
-    while True:
-        product_id = await r.lpop("price_tasks")  # Ждём задачу
-        if product_id is None:
-            await asyncio.sleep(1)  # Если нет задач — ждём
-            continue
+    try:
+        while True:
+            task = await claim_task(r, worker_id)  # Берём задачу в аренду
+            if task is None:
+                await asyncio.sleep(1)  # Если нет задач — ждём
+                continue
 
-        print(f"Получена задача: product_id={product_id.decode()}")
-        try:
-            await database.connect()
-            await create_price_record_from_ozon(int(product_id))
-            print(f"✅ Обработано: product_id={product_id.decode()}")
-        except Exception as e:
-            print(f"❌ Ошибка при обработке {product_id.decode()}: {e}")
-        finally:
-            await database.disconnect()
+            state["task"] = task
+            product_id = task_product_id(task)
+            ok = False
+            print(f"Получена задача: product_id={product_id}")
+            try:
+                await database.connect()
+                record, created = await scrape_ozon_price(product_id)
+                if created:
+                    # цена изменилась — дашборды обновят только эту строку
+                    await publish_price_event(r, record)
+                ok = True
+                print(f"✅ Обработано: product_id={product_id}")
+            except Exception as e:
+                print(f"❌ Ошибка при обработке {product_id}: {e}")
+            finally:
+                await database.disconnect()
+                await complete_task(r, worker_id, task, ok)
+                state["task"] = None
+    finally:
+        beat.cancel()
+        await unregister_worker(r, worker_id)
 
 if __name__ == "__main__":
     asyncio.run(worker())
\ No newline at end of file